@@ -4,10 +4,19 @@
 import math
 import random
 from referee.game import \
-    PlayerColor, Action, SpawnAction, SpreadAction, HexPos, HexDir, Board
+    PlayerColor, Action, SpawnAction, SpreadAction, HexPos
 from referee.game.constants import *
 from referee.game.exceptions import *
-from copy import deepcopy
+from infexion.bitboard import BitBoard, iter_bits
+from infexion.book import OpeningBook
+from infexion.endgame import EndgameSolver, book_or_endgame_move
+from infexion.instrument import instrumented, move_stats
+from infexion.rollout import playout
+from infexion.tables import ACTIONS, action_index
+from infexion.symmetry import unique_moves, stabilizer, compose, map_move, unmap_move, transform_key
+from infexion.memory import tree_memory
+from infexion.snapshot import snapshot
+from concurrent.futures import ProcessPoolExecutor
 import time
 
 
@@ -27,23 +36,64 @@ COORDINATES = [
     for q in range(7)
     if abs(r - q) < 7
 ]
+
+# parallel search for the BLUE agent: None runs the plain single process
+# search, "root" grows one independent tree per worker and merges the root
+# children, "leaf" selects a batch of leaves and plays their rollouts on the
+# workers, MCTS_LEAF_BATCH leaves per worker per round trip
+MCTS_PARALLEL = None
+MCTS_WORKERS = 4
+MCTS_LEAF_BATCH = 8
+
+# rollouts stop after this many plies and the position is scored by the
+# power difference, None plays every rollout out to the end of the game
+ROLLOUT_PLY_CAP = 100
+
+# the kept tree stops growing at this many nodes, selection then only walks
+# the nodes it already has
+MCTS_NODE_BUDGET = 200000
+
+# progressive widening, a node with n visits may have at most
+# int(C * (n + 1) ** alpha) children, expanded best prior first. None expands
+# every child before going deeper
+MCTS_WIDENING = (1.0, 0.5)
+
+# symmetric moves are only merged into one child this many plies into the
+# game, later positions almost never have a symmetry to find
+MCTS_SYMMETRY_PLIES = 6
+
 class Agent:
     def __init__(self, color: PlayerColor, **referee: dict):
         """
         Initialise the agent.
         """
         self._color = color
-        self.game_state = Board()
+        self.game_state = BitBoard()
+        # search tree kept between moves, re-rooted in turn()
+        self.mcts = None
+        # BLUE moves searched, and how many of them started from a kept tree
+        self.searches = 0
+        self.reuses = 0
+        self.pool = ProcessPoolExecutor(MCTS_WORKERS) if MCTS_PARALLEL else None
+        self.book = OpeningBook()
+        # playouts run for the last move
+        self.nodes = 0
+        self.endgame = EndgameSolver()
+        self.stats = move_stats("agent")
         match color:
             case PlayerColor.RED:
                 print("Testing: I am playing as red")
             case PlayerColor.BLUE:
                 print("Testing: I am playing as blue")
 
+    @instrumented
     def action(self, **referee: dict) -> Action:
         """
         Return the next action to take.
         """
+        quick_action = book_or_endgame_move(self, self.game_state, referee)
+        if quick_action is not None:
+            return quick_action
         match self._color:
             case PlayerColor.RED:
                 mcts = MCTS(self.game_state, PlayerColor.RED, num_iterations=10)
@@ -51,7 +101,7 @@ class Agent:
                 while True:
                     try:
                         best_action = random.choice(spawns)
-                        copy_state = deepcopy(self.game_state)
+                        copy_state = self.game_state.copy()
                         copy_state.apply_action(best_action)
                         break
                     except IllegalActionException:
@@ -59,9 +109,25 @@ class Agent:
                         
                 return best_action
             case PlayerColor.BLUE:
-                mcts = MCTS(self.game_state, PlayerColor.BLUE, num_iterations=500)
-                best_action = mcts.search()
-                mcts.print_tree(max_depth=343)
+                self.searches += 1
+                if self.mcts is not None:
+                    self.reuses += 1
+                else:
+                    self.mcts = MCTS(self.game_state.copy(), PlayerColor.BLUE, num_iterations=500,
+                                     workers=MCTS_WORKERS, parallel=MCTS_PARALLEL, pool=self.pool,
+                                     leaf_batch=MCTS_LEAF_BATCH,
+                                     rollout_ply_cap=ROLLOUT_PLY_CAP, max_nodes=MCTS_NODE_BUDGET,
+                                     widening=MCTS_WIDENING)
+                # the kept tree outlives the move, so hand it this move's stats
+                self.mcts.stats = self.stats
+                visits = self.mcts.root.visits
+                best_action = self.mcts.search()
+                self.nodes += self.mcts.root.visits - visits
+                if self.stats is not None:
+                    self.stats.set(reused_visits=visits, tree_reuse_rate=self.reuses / self.searches)
+                # written only when INFEXION_SNAPSHOTS is set, see infexion.snapshot.
+                # the tree's moves are in its own frame, so is its position
+                snapshot("agent", self.mcts.root, self.mcts.root.state)
                 return best_action
 
     def turn(self, color: PlayerColor, action: Action, **referee: dict):
@@ -69,6 +135,12 @@ class Agent:
         Update the agent with the last player's action.
         """
         self.game_state.apply_action(action)
+        # follow both our move and the reply down the kept tree, starting
+        # over only when the new position was never expanded
+        if self.mcts is not None:
+            if not self.mcts.advance(action) or \
+                    self.mcts.root.state.key != transform_key(self.game_state, self.mcts.frame):
+                self.mcts = None
         match action:
             case SpawnAction(cell):
                 print(f"Testing: {color} SPAWN at {cell}")
@@ -78,142 +150,321 @@ class Agent:
                 pass
 
 class Node:
-    def __init__(self, state: Board, color: PlayerColor, parent=None, action=None):
+    # only the root keeps a board, the search replays the actions from the
+    # root to get the position of any other node
+    __slots__ = ("color", "state", "parent", "action", "children", "wins", "visits",
+                 "untried", "terminal", "size")
+
+    def __init__(self, state: BitBoard, color: PlayerColor, parent=None, action=None):
         self.color = color
-        self.state = state
+        self.state = state if parent is None else None
         self.parent = parent
         self.action = action
         self.children = []
         self.wins = 0
         self.visits = 0
-        self.available_spawns, self.available_spreads = self.get_legal_actions()
+        self.terminal = state.game_over
+        # move indices (see infexion.tables) not expanded yet, best prior
+        # last. None until the node is first expanded
+        self.untried = None
+        # nodes in the subtree under this node, itself included
+        self.size = 1
 
     def add_child(self, child):
         self.children.append(child)
+        node = self
+        while node is not None:
+            node.size += 1
+            node = node.parent
 
     def is_terminal_node(self):
-        return self.state.game_over
+        return self.terminal
     
         
-    def get_legal_actions(self):
-        # return a list of leagl actions
-        board = self.state
-        color = self.color
-        dim = BOARD_N
-        spawns = []
-        spreads = []
-        directions = [HexDir.Down, HexDir.DownLeft, HexDir.DownRight, HexDir.Up, HexDir.UpLeft, HexDir.UpRight]
-        for cor in COORDINATES:
-            if board._cell_occupied(cor):
-                cellColor, cellPower = board[cor]
-                if cellColor == color:
-                    for direction in directions:
-                        spreads.append(SpreadAction(cor, direction))
-            else:
-                spawns.append(SpawnAction(cor))
-        return spawns, spreads
+    def get_legal_actions(self, state=None):
+        # return a list of leagl actions, the node color is always the side to move
+        if state is None:
+            state = self.state
+        return state.spawn_actions(), state.spread_actions()
 
 class MCTS:
-    def __init__(self, root_state, curr_color, num_iterations=10, exploration_parameter=math.sqrt(2)):
+    def __init__(self, root_state, curr_color, num_iterations=10, exploration_parameter=math.sqrt(2),
+                 workers=1, parallel=None, pool=None, rollout_ply_cap=None, max_nodes=None,
+                 widening=None, stats=None, leaf_batch=8):
         self.root = Node(root_state, curr_color)
+        # board the selected path is replayed on, see Node
+        self.scratch = root_state.copy()
+        self.max_nodes = max_nodes
+        self.node_count = 1
+        # transform from the game's position to the tree's, not the identity
+        # once advance() has followed a move into its symmetric twin
+        self.frame = 0
+        # (C, alpha) for progressive widening, see MCTS_WIDENING
+        self.widening = widening
+        # SearchStats of the move, None when instrumentation is off
+        self.stats = stats
         self.num_iterations = num_iterations
         self.exploration_parameter = exploration_parameter
+        self.rollout_ply_cap = rollout_ply_cap
+        # parallel is None, "root" or "leaf", see MCTS_PARALLEL
+        self.workers = workers
+        self.parallel = parallel if workers > 1 else None
+        self.leaf_batch = leaf_batch
+        self.pool = pool
+        if self.parallel is not None and self.pool is None:
+            self.pool = ProcessPoolExecutor(workers)
 
     # search for the best child
     def search(self):
         start_time = time.time()
-        # loop for iterations, later on changed to time
-        for i in range(self.num_iterations):
-            #print(i)
-            iteration_start_time = time.time()
-
-            # selection, needs check
-            selected_node = self.select_node(self.root)
-            #s_end_time = time.time()
-            #print(f"Selection {i + 1} took {s_end_time - iteration_start_time:.6f} seconds")
-
-            if not selected_node.is_terminal_node():
-                selected_node = self.expand(selected_node)
-            #e_end_time = time.time()
-            #print(f"Expansions {i + 1} took {e_end_time - iteration_start_time:.6f} seconds")
-
-            #simulation for selected node
-            winner_color = self.rollout(selected_node)
-            #r_end_time = time.time()
-            #print(f"Rollout {i + 1} took {r_end_time - iteration_start_time:.6f} seconds")
-            #back propagation
-            self.backpropagate(selected_node, (winner_color == self.root.color))
-
-            #iteration_end_time = time.time()
-            #print(f"Iteration {i + 1} took {iteration_end_time - iteration_start_time:.6f} seconds")
-
-        #after iteration, choose the best child
+        if self.parallel == "root":
+            self.root_parallel_search()
+        elif self.parallel == "leaf":
+            # every batch plays leaf_batch rollouts per worker, so the same
+            # number of playouts needs fewer rounds
+            for i in range(-(-self.num_iterations // (self.workers * self.leaf_batch))):
+                self.run_leaf_batch()
+        else:
+            # loop for iterations, later on changed to time
+            for i in range(self.num_iterations):
+                self.run_iteration()
+
+        #after iteration, choose the best child, back in the game's frame
         best_child = self.best_child(self.root, 0)
+        best_action = best_child.action
+        if self.frame:
+            best_action = ACTIONS[unmap_move(action_index(best_action), self.frame)]
         end_time = time.time()
         print(f"total took {end_time - start_time:.6f} seconds")
-        return best_child.action
+        if self.stats is not None:
+            # the byte count walks the whole tree, so only when measuring
+            self.stats.set(tree_nodes=self.node_count, tree_bytes=self.memory()["bytes"])
+        return best_action
+
+    def run_iteration(self):
+        # per phase timers when instrumentation is on, see infexion.instrument
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+
+        # selection, needs check
+        state = self.scratch
+        state.restore(self.root.state)
+        if stats is not None:
+            start = stats.lap("copy", start)
+        selected_node = self.select_node(self.root, state)
+        if stats is not None:
+            start = stats.lap("select", start)
+
+        if not selected_node.is_terminal_node() and not self.tree_full():
+            selected_node = self.expand(selected_node, state)
+        if stats is not None:
+            start = stats.lap("expand", start)
+
+        #simulation for selected node
+        winner_color = self.rollout(state)
+        if stats is not None:
+            start = stats.lap("rollout", start)
+        #back propagation
+        self.backpropagate(selected_node, winner_color)
+        if stats is not None:
+            stats.lap("backprop", start)
+            stats.count("rollouts")
+            depth = 0
+            node = selected_node
+            while node.parent is not None:
+                depth += 1
+                node = node.parent
+            stats.maximum("depth", depth)
+
+    #leaf parallelism, one round trip per worker for a whole batch of leaves.
+    #Every selected path takes a virtual loss (a visit with no win) until its
+    #rollout is back, so the selections after it spread over other leaves
+    def run_leaf_batch(self):
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        leaves = []
+        for i in range(self.workers * self.leaf_batch):
+            state = self.root.state.copy()
+            node = self.select_node(self.root, state)
+            if not node.is_terminal_node() and not self.tree_full():
+                node = self.expand(node, state)
+            self.virtual_loss(node, 1)
+            leaves.append((node, state))
+        if stats is not None:
+            start = stats.lap("select", start)
+
+        share = self.leaf_batch
+        jobs = [
+            ([state for _, state in leaves[i:i + share]], self.rollout_ply_cap, random.getrandbits(32))
+            for i in range(0, len(leaves), share)
+        ]
+        winners = [winner for batch in self.pool.map(_rollout_worker, jobs) for winner in batch]
+        if stats is not None:
+            start = stats.lap("rollout", start)
+
+        for (node, _), winner_color in zip(leaves, winners):
+            self.virtual_loss(node, -1)
+            self.backpropagate(node, winner_color)
+        if stats is not None:
+            stats.lap("backprop", start)
+            stats.count("rollouts", len(winners))
+
+    #add visits to node and every node above it, negative takes them back
+    def virtual_loss(self, node, visits):
+        while node is not None:
+            node.visits += visits
+            node = node.parent
+
+    #root parallelism, every worker grows its own tree from the root and
+    #the root children stats are added into this tree
+    def root_parallel_search(self):
+        share = -(-self.num_iterations // self.workers)
+        jobs = [
+            (self.root.state, self.root.color, share, self.exploration_parameter,
+             self.rollout_ply_cap, self.widening, random.getrandbits(32))
+            for _ in range(self.workers)
+        ]
+        for root_wins, root_visits, child_stats in self.pool.map(_root_parallel_worker, jobs):
+            self.root.wins += root_wins
+            self.root.visits += root_visits
+            for action, wins, visits in child_stats:
+                child = self.get_child(self.root, action)
+                child.wins += wins
+                child.visits += visits
 
     #need check and fix!
-    def select_node(self, node: Node):
+    #state is the board at node, moved down along with the selection
+    def select_node(self, node: Node, state: BitBoard):
 
-        # if the selected node is not full expanded, return the node, else find the best children
-        if node.available_spawns or node.available_spreads:
+        # if the selected node may still grow a child, return the node, else find the best children
+        if self.can_expand(node, state) or not node.children:
             return node
-        else:
-            best_child = self.best_child(node, self.exploration_parameter)
-            return self.select_node(best_child)
-        
-    #expand the node, and add all available child
-    def expand(self, node: Node):
-        available_actions = node.available_spawns + node.available_spreads
-        if not available_actions:
+        best_child = self.best_child(node, self.exploration_parameter)
+        state.apply(best_child.action)
+        return self.select_node(best_child, state)
+
+    def tree_full(self):
+        return self.max_nodes is not None and self.node_count >= self.max_nodes
+
+    def can_expand(self, node: Node, state: BitBoard):
+        if node.terminal or self.tree_full():
+            return False
+        if self.widening is not None:
+            constant, exponent = self.widening
+            if len(node.children) >= int(constant * (node.visits + 1) ** exponent):
+                return False
+        return bool(self.untried_moves(node, state))
+
+    #legal moves of node that have no child yet, generated the first time
+    #they are needed and ordered by the prior
+    def untried_moves(self, node: Node, state: BitBoard):
+        if node.untried is None:
+            if self.stats is not None:
+                start = time.perf_counter()
+            node.untried = self.prior_order(state)
+            if self.stats is not None:
+                self.stats.lap("move_gen", start)
+            for child in node.children:
+                if action_index(child.action) in node.untried:
+                    node.untried.remove(action_index(child.action))
+        return node.untried
+
+    #move indices of state best last: captures by how much power they swing,
+    #then the other moves the same way, ties broken at random. Early in the
+    #game, moves that a symmetry of the position maps onto each other share
+    #one child
+    def prior_order(self, state: BitBoard):
+        moves = iter_bits(state.legal_move_mask())
+        if state.turn_count < MCTS_SYMMETRY_PLIES:
+            moves = unique_moves(state, moves)
+        scored = []
+        for index in moves:
+            is_capture, delta = state.capture_delta(ACTIONS[index])
+            scored.append((is_capture, delta, random.random(), index))
+        scored.sort()
+        return [index for _, _, _, index in scored]
+
+    #expand the node with its best untried move
+    def expand(self, node: Node, state: BitBoard):
+        untried = self.untried_moves(node, state)
+        if not untried:
             return
-        if node.state._total_power >= 49:
-                available_actions = node.available_spreads
-        action = random.choice(available_actions)
-        child_state = deepcopy(node.state)
-        child_state.apply_action(action)
+        return self.add_child(node, ACTIONS[untried[-1]], state)
+
+    #state is the board at node, it is moved on to the new child
+    def add_child(self, node: Node, action, state: BitBoard):
+        state.apply(action)
         child_color = _SWITCH_COLOR[node.color]
-        child_node = Node(child_state, child_color, node, action)
-        if action in node.available_spawns:
-            node.available_spawns.remove(action)
-        else:
-            node.available_spreads.remove(action)
+        child_node = Node(state, child_color, node, action)
+        if node.untried is not None and action_index(action) in node.untried:
+            node.untried.remove(action_index(action))
         node.add_child(child_node)
+        self.node_count += 1
+        if self.stats is not None:
+            self.stats.count("nodes")
         return child_node
 
+    #existing root child reached by action, expanded if it is not in the tree yet
+    def get_child(self, node: Node, action):
+        for child in node.children:
+            if child.action == action:
+                return child
+        return self.add_child(node, action, node.state.copy())
+
     #simulations
-    def rollout(self, node):
-        #create copy node
-        tmp_node = deepcopy(node)
-        curr_color = tmp_node.color
-        curr_state = tmp_node.state
-        depth = 0
-        #loop until game over
-        while not curr_state.game_over:
-            #it needs to be expending nodes and switch side at the same time, below comment code is wrong
-
-
-            spawns, spreads = tmp_node.get_legal_actions()
-            #random move
-            if curr_state._total_power >= 49:
-                curr_state.apply_action(random.choice(spreads))
-            else:
-                all_actions = spawns + spreads
-                curr_state.apply_action(random.choice(all_actions))
-            tmp_node.state = curr_state
-            # need check 
-            curr_color = _SWITCH_COLOR[curr_color]
-            tmp_node.color = curr_color
-            depth +=1
-        return curr_state.winner_color
+    def rollout(self, state):
+        return playout(state, self.rollout_ply_cap)
             
-    #back propagation 
-    def backpropagate(self, node, result):
+    #back propagation, each node counts wins for the player who moved into
+    #it, so the stats stay right when a deeper node becomes the root
+    def backpropagate(self, node, winner_color):
         node.visits += 1
-        node.wins += result
+        node.wins += (winner_color == _SWITCH_COLOR[node.color])
         if node.parent:
-            self.backpropagate(node.parent, 1 - result)
+            self.backpropagate(node.parent, winner_color)
+
+    #move the root down to the child reached by action, keeping its stats.
+    #the new root takes over the old root's board. A move that prior_order
+    #merged into a symmetric twin follows the twin, and the tree's frame
+    #takes on the symmetry that maps one onto the other
+    def advance(self, action):
+        move = action_index(action)
+        if self.frame:
+            move = map_move(move, self.frame)
+        child = self.find_child(self.root, move)
+        if child is None:
+            child, symmetry = self.find_twin(self.root, move)
+            if child is None:
+                return False
+            self.frame = compose(symmetry, self.frame)
+        child.parent = None
+        child.state = self.root.state
+        child.state.apply(child.action)
+        self.root = child
+        self.node_count = child.size
+        return True
+
+    def find_child(self, node: Node, move):
+        for child in node.children:
+            if action_index(child.action) == move:
+                return child
+        return None
+
+    #(child, symmetry) for the child a symmetry of node's position maps move
+    #onto, only the root has the board to check
+    def find_twin(self, node: Node, move):
+        for symmetry in stabilizer(node.state):
+            if symmetry:
+                child = self.find_child(node, map_move(move, symmetry))
+                if child is not None:
+                    return child, symmetry
+        return None, 0
+
+    #nodes and bytes held by the tree, see infexion.memory
+    def memory(self):
+        return tree_memory(self.root)
 
     def best_child(self, node, exploration_parameter):
         def uct(child):
@@ -222,16 +473,21 @@ class MCTS:
             )
 
         return max(node.children, key=uct)
-    
-    def print_tree(self, node=None, depth=0, max_depth=None):
-        if node is None:
-            node = self.root
 
-        if max_depth is not None and depth > max_depth:
-            return
 
-        print("  " * depth, node.action, node.wins, node.visits)
-        for child in node.children:
-            self.print_tree(child, depth + 1, max_depth)
+#pool workers, module level so they can be pickled by name. Each job
+#carries its own seed, forked workers would otherwise share a random state
+def _rollout_worker(job):
+    states, ply_cap, seed = job
+    random.seed(seed)
+    return [playout(state, ply_cap) for state in states]
 
 
+def _root_parallel_worker(job):
+    state, color, iterations, exploration_parameter, ply_cap, widening, seed = job
+    random.seed(seed)
+    mcts = MCTS(state, color, iterations, exploration_parameter, rollout_ply_cap=ply_cap, widening=widening)
+    for i in range(iterations):
+        mcts.run_iteration()
+    child_stats = [(child.action, child.wins, child.visits) for child in mcts.root.children]
+    return mcts.root.wins, mcts.root.visits, child_stats
@@ -2,8 +2,16 @@
 # Project Part B: Game Playing Agent
 
 from referee.game import \
-    PlayerColor, Action, SpawnAction, SpreadAction, HexPos, HexDir
+    PlayerColor, Action, SpawnAction, SpreadAction
 from referee.game.constants import *
+from infexion.bitboard import BitBoard, COLOR_INDEX
+from infexion.book import OpeningBook
+from infexion.endgame import EndgameSolver, book_or_endgame_move
+from infexion.zobrist import ZOBRIST_BLUE, piece_key
+from infexion.tables import NUM_CELLS, DIRECTION_INDEX, RAYS, SPAWN_ACTIONS, SPREAD_ACTIONS
+from infexion.ordering import MoveOrderer
+from infexion.search import null_window
+from infexion.instrument import instrumented, move_stats
 import numpy as np
 import random
 
@@ -12,51 +20,190 @@ SWITCH_COLOR = {
     PlayerColor.BLUE: PlayerColor.RED
 }
 
-DIRECTIONS = [HexDir.Down, HexDir.DownLeft, HexDir.DownRight, HexDir.Up, HexDir.UpLeft, HexDir.UpRight]
+# the board is two int8 planes over the 49 cells, OWNER holds 0 for an empty
+# cell and the colour's code otherwise, POWER the stack's power
+OWNER = 0
+POWER = 1
+EMPTY = 0
+OWNER_CODE = {PlayerColor.RED: 1, PlayerColor.BLUE: 2}
+# every cell index once, for gathers over the whole board
+CELLS = np.arange(NUM_CELLS)
+# RAY_INDEX[cell, direction] is the wrapped ray of RAYS as an index array,
+# a spread of power p touches RAY_INDEX[cell, direction, :p]
+RAY_INDEX = np.array(RAYS, dtype=np.intp)
+# PLANE_KEYS[owner, power, cell] is the Zobrist key of that stack, 0 for an
+# empty cell
+PLANE_KEYS = np.zeros((3, MAX_CELL_POWER + 1, NUM_CELLS), dtype=np.uint64)
+for _color, _code in OWNER_CODE.items():
+    for _power in range(1, MAX_CELL_POWER + 1):
+        for _cell in range(NUM_CELLS):
+            PLANE_KEYS[_code, _power, _cell] = piece_key(_cell, COLOR_INDEX[_color], _power)
+# what a spread by code leaves on a target cell that held a stack of the
+# given power: SPREAD_RESULT[code][:, power] is (owner, power) after, a
+# stack reaching 7 is removed. SPREAD_KEYS[code, owner, power, cell] is the
+# key change on that cell, so a whole ray is updated with one gather each
+SPREAD_RESULT = np.zeros((3, 2, MAX_CELL_POWER + 1), dtype=np.int8)
+SPREAD_KEYS = np.zeros((3, 3, MAX_CELL_POWER + 1, NUM_CELLS), dtype=np.uint64)
+for _code in OWNER_CODE.values():
+    for _power in range(MAX_CELL_POWER + 1):
+        if _power < MAX_CELL_POWER:
+            SPREAD_RESULT[_code, :, _power] = (_code, _power + 1)
+    for _owner in range(3):
+        for _power in range(MAX_CELL_POWER + 1):
+            _after_owner, _after_power = SPREAD_RESULT[_code, :, _power]
+            SPREAD_KEYS[_code, _owner, _power] = \
+                PLANE_KEYS[_owner, _power] ^ PLANE_KEYS[_after_owner, _after_power]
+
 
 class NewBoard:
-    def __init__(self, color, turn, board):
+    """
+    Owner and power planes held in one contiguous (2, 49) int8 array, so
+    copying a position is a 98 byte memcpy and undo just puts the old array
+    back. Spreads update the planes with one gather and scatter along a
+    precomputed ray. The power and cell totals start as reductions over the
+    planes and are then kept up to date move by move, and a plain list copy
+    of the planes is made for move ordering once per position.
+    """
+    def __init__(self, color, turn, planes):
         self._color = color
         self._turn = turn
-        if board is None:
-            self._board = np.empty((7, 7), dtype=object)
-
+        if planes is None:
+            self._planes = np.zeros((2, NUM_CELLS), dtype=np.int8)
         else:
-            board_copy = board.copy()
-            self._board = board_copy
+            self._planes = planes.copy()
+        self._key = self.compute_key()
+        self._powers, self._cells = self.compute_totals()
+        self._lists = None
+
+    def copy(self):
+        other = NewBoard.__new__(NewBoard)
+        other._color = self._color
+        other._turn = self._turn
+        other._planes = self._planes.copy()
+        other._key = self._key
+        other._powers = self._powers.copy()
+        other._cells = self._cells.copy()
+        other._lists = self._lists
+        return other
+
+    def compute_key(self):
+        """
+        Zobrist key of the position, spawns and spreads keep self._key updated
+        """
+        key = ZOBRIST_BLUE if self._color == PlayerColor.BLUE else 0
+        owner, power = self._planes
+        return key ^ int(np.bitwise_xor.reduce(PLANE_KEYS[owner, power, CELLS]))
+
+    def compute_totals(self):
+        """
+        (power, cells) per owner code, indexed by OWNER_CODE, as reductions
+        over the planes. Spawns and spreads keep them updated from there
+        """
+        owner, power = self._planes
+        return (np.bincount(owner, weights=power, minlength=3).astype(int).tolist(),
+                np.bincount(owner, minlength=3).tolist())
+
+    def totals(self):
+        return self._powers, self._cells
+
+    def lists(self):
+        """
+        the planes as two python lists, for the per cell reads of move
+        ordering which are slow on numpy scalars. Kept until the board changes
+        """
+        if self._lists is None:
+            self._lists = self._planes.tolist()
+        return self._lists
+
+    def spawn(self, cell, color):
+        idx = cell.r * 7 + cell.q
+        code = OWNER_CODE[color]
+        self._planes[OWNER, idx] = code
+        self._planes[POWER, idx] = 1
+        self._key ^= int(PLANE_KEYS[code, 1, idx])
+        self._powers[code] += 1
+        self._cells[code] += 1
+        self._cells[EMPTY] -= 1
+        self._lists = None
 
     def spread(self, cell, direction, color):
-        power = self._board[cell.r][cell.q][1]
-        self._board[cell.r][cell.q] = None
-        while power > 0:
-            new_cell = HexPos(cell.r, cell.q) + direction
-            if self._board[new_cell.r][new_cell.q] == None:
-                self._board[new_cell.r][new_cell.q] = (color, 1)
+        owner, power = self._planes
+        origin = cell.r * 7 + cell.q
+        code = OWNER_CODE[color]
+        steps = int(power[origin])
+        # wrapped target cells come from the precomputed ray for this direction
+        targets = RAY_INDEX[origin, DIRECTION_INDEX[direction], :steps]
+        old_owner = owner[targets]
+        old_power = power[targets]
+        # at most 6 keys, xoring them in python beats a ufunc reduce
+        key = self._key ^ int(PLANE_KEYS[code, steps, origin])
+        for changed in SPREAD_KEYS[code, old_owner, old_power, targets].tolist():
+            key ^= changed
+        self._key = key
+        # the totals move by what was on the ray, again too few cells for numpy
+        powers = self._powers
+        cells = self._cells
+        powers[code] -= steps
+        cells[code] -= 1
+        cells[EMPTY] += 1
+        for target_owner, target_power in zip(old_owner.tolist(), old_power.tolist()):
+            powers[target_owner] -= target_power
+            cells[target_owner] -= 1
+            if target_power < MAX_CELL_POWER:
+                powers[code] += target_power + 1
+                cells[code] += 1
             else:
-                new_cell_power = self._board[new_cell.r][new_cell.q][1] + 1
-                if new_cell_power > 6:
-                    self._board[new_cell.r][new_cell.q] = None
-                else:
-                    self._board[new_cell.r][new_cell.q] = (color, new_cell_power)
-            cell = new_cell
-            power -= 1
+                cells[EMPTY] += 1
+        owner[origin] = EMPTY
+        power[origin] = 0
+        result = SPREAD_RESULT[code]
+        owner[targets] = result[OWNER, old_power]
+        power[targets] = result[POWER, old_power]
+        self._lists = None
 
+    def capture_delta(self, action):
+        """
+        whether the action takes over any opponent stack, and how much it
+        changes (own power - opponent power) for the side to move, used for
+        move ordering without applying anything
+        """
+        match action:
+            case SpawnAction():
+                return False, 1
+            case SpreadAction(cell, direction):
+                owner, power = self.lists()
+                origin = cell.r * 7 + cell.q
+                steps = power[origin]
+                code = OWNER_CODE[self._color]
+                capture = False
+                delta = -steps
+                for target in RAYS[origin][DIRECTION_INDEX[direction]][:steps]:
+                    target_owner = owner[target]
+                    target_power = power[target]
+                    if target_owner == EMPTY:
+                        delta += 1
+                    elif target_owner != code:
+                        capture = True
+                        delta += target_power + (target_power + 1 if target_power < 6 else 0)
+                    elif target_power == 6:
+                        delta -= 6
+                    else:
+                        delta += 1
+                return capture, delta
 
     def get_total_power(self):
-        total_sum = sum(element[1] for row in self._board for element in row if element is not None)
-        return total_sum
+        powers, _ = self.totals()
+        return powers[1] + powers[2]
     
     def get_legal_actions(self):
         spawns = []
         spreads = []
-        for i in range(7):
-            for j in range(7):
-                cell = self._board[i][j]
-                if cell is None and self._turn != 343:
-                    spawns.append(SpawnAction(HexPos(i, j)))
-                if cell is not None and cell[0] == self._color and self._turn != 343:
-                    for direction in DIRECTIONS:
-                        spreads.append(SpreadAction(HexPos(i, j), direction))
+        if self._turn != 343:
+            # hand out the shared action objects instead of building new ones
+            owner = self._planes[OWNER]
+            spawns = [SPAWN_ACTIONS[idx] for idx in np.flatnonzero(owner == EMPTY).tolist()]
+            for idx in np.flatnonzero(owner == OWNER_CODE[self._color]).tolist():
+                spreads += SPREAD_ACTIONS[idx]
         random.shuffle(spawns)
         if self.get_total_power() >= 49:
             return spreads
@@ -64,16 +211,9 @@ class NewBoard:
             return spreads + spawns
 
     def is_terminal(self):
-        self_power = 0
-        oppo_power = 0
-        for r in range(7):
-            for q in range(7):
-                cell = self._board[r][q]
-                if cell is not None:
-                    if cell[0] == self._color:
-                        self_power += cell[1]
-                    else:
-                        oppo_power += cell[1]
+        powers, _ = self.totals()
+        self_power = powers[OWNER_CODE[self._color]]
+        oppo_power = powers[OWNER_CODE[SWITCH_COLOR[self._color]]]
         
         if (self_power == 0 and self._turn != 0) or (oppo_power == 0 and self._turn != 0) or \
             (self_power == 0 and oppo_power == 0 and self._turn != 0) or (self._turn >= 343):
@@ -81,22 +221,13 @@ class NewBoard:
         return False
     
     def evaluation(self, rootcolor):
-
-        opp_power = 0
-        self_power = 0
-        opp_cells = 0
-        self_cells = 0
-
-        for r in range(7):
-            for q in range(7):
-                cell = self._board[r][q]
-                if cell is not None:
-                    if cell[0] == rootcolor:
-                        self_power += cell[1]
-                        self_cells += 1
-                    else:
-                        opp_power += cell[1]
-                        opp_cells += 1
+        powers, cells = self.totals()
+        self_code = OWNER_CODE[rootcolor]
+        opp_code = OWNER_CODE[SWITCH_COLOR[rootcolor]]
+        self_power = powers[self_code]
+        opp_power = powers[opp_code]
+        self_cells = cells[self_code]
+        opp_cells = cells[opp_code]
 
         power_score = self_power - opp_power
         cell_score = self_cells - opp_cells
@@ -118,11 +249,29 @@ class NewBoard:
 
         match action:
             case SpawnAction(cell):
-                self._board[cell.r][cell.q] = (self._color, 1)
+                self.spawn(cell, self._color)
             case SpreadAction(cell, direction):
                 self.spread(cell, direction, self._color)
         self._turn += 1
         self._color = SWITCH_COLOR[self._color]
+        self._key ^= ZOBRIST_BLUE
+
+    def apply(self, action):
+        """
+        apply the action in place and return the undo record, a copy of the
+        planes from before the move (98 bytes) with the key and totals
+        """
+        record = (self._planes.copy(), self._key, self._powers.copy(), self._cells.copy(), self._lists)
+        self.apply_action(action)
+        return record
+
+    def undo(self, record):
+        """
+        take back the last applied action using the record from apply
+        """
+        self._planes, self._key, self._powers, self._cells, self._lists = record
+        self._turn -= 1
+        self._color = SWITCH_COLOR[self._color]
             
 
     
@@ -137,6 +286,14 @@ class Agent:
         else:
             self._turn = 0
         self.game_state = NewBoard(self._color, self._turn, None)
+        # the same game as a BitBoard, which the opening book and the
+        # endgame solver work on
+        self.position = BitBoard()
+        self.book = OpeningBook()
+        self.endgame = EndgameSolver()
+        # nodes searched for the last move
+        self.nodes = 0
+        self.stats = move_stats("dfs-board")
 
         match color:
             case PlayerColor.RED:
@@ -144,92 +301,144 @@ class Agent:
             case PlayerColor.BLUE:
                 print("Testing: I am playing as blue")
 
+    @instrumented
     def action(self, **referee: dict) -> Action:
         """
         Return the next action to take.
         """
+        self._turn += 2
+        quick_action = book_or_endgame_move(self, self.position, referee)
+        if quick_action is not None:
+            return quick_action
         match self._color:
             case PlayerColor.RED:
-                self._turn += 2
                 #print(self._turn)
-                minimax = MiniMax(self.game_state, self._turn, PlayerColor.RED, max_depth=3)
+                minimax = MiniMax(self.game_state, self._turn, PlayerColor.RED, max_depth=3, search="pvs")
                 best_action = minimax.find_next_step()
+                self.nodes += minimax.nodes
+                if self.stats is not None:
+                    self.stats.set(depth=minimax.max_depth)
+                    self.stats.count("nodes", minimax.nodes)
                 #return random.choice(actions)
                 return best_action
             case PlayerColor.BLUE:
                 # This is going to be invalid... BLUE never spawned!
-                self._turn += 2
                 #print(self._turn)
-                minimax = MiniMax(self.game_state, self._turn, PlayerColor.BLUE, max_depth=3)
-                #print(self.game_state._board)
+                minimax = MiniMax(self.game_state, self._turn, PlayerColor.BLUE, max_depth=3, search="pvs")
+                #print(self.game_state._planes)
                 best_action = minimax.find_next_step()
+                self.nodes += minimax.nodes
+                if self.stats is not None:
+                    self.stats.set(depth=minimax.max_depth)
+                    self.stats.count("nodes", minimax.nodes)
                 return best_action
 
     def turn(self, color: PlayerColor, action: Action, **referee: dict):
         """
         Update the agent with the last player's action.
         """
+        self.position.apply_action(action)
         match action:
             case SpawnAction(cell):
                 print(f"Testing: {color} SPAWN at {cell}")
-                self.game_state._board[cell.r][cell.q] = (color, 1)
+                self.game_state.spawn(cell, color)
                 pass
             case SpreadAction(cell, direction):
                 self.game_state.spread(cell, direction, color)
-                #print(self.game_state._board)
+                #print(self.game_state._planes)
                 print(f"Testing: {color} SPREAD from {cell}, {direction}")
                 pass
     
 class MiniMax:
-    def __init__(self, root_state, turn, curr_color, max_depth):
-        self.root = NewBoard(curr_color, turn, root_state._board)
+    def __init__(self, root_state, turn, curr_color, max_depth, ordering="heuristic", search="alphabeta"):
+        self.root = NewBoard(curr_color, turn, root_state._planes)
+        # the search mutates self.root, so keep the colour we are playing for
+        self.root_color = curr_color
         self.max_depth = max_depth
+        # "heuristic" orders moves with the MoveOrderer, "shuffle" keeps the
+        # generation order (spreads, then shuffled spawns)
+        self.ordering = ordering
+        self.orderer = MoveOrderer()
+        # "alphabeta" searches every root move in a full window, "pvs" carries
+        # alpha across the root and proves later moves with null windows
+        self.search = search
+        # positions visited by the search, leaves included
+        self.nodes = 0
+
+    def order_moves(self, board: NewBoard, depth):
+        legal_actions = board.get_legal_actions()
+        if self.ordering == "heuristic":
+            return self.orderer.order(board, legal_actions, depth)
+        return legal_actions
+
+    def record_cutoff(self, board: NewBoard, action, depth, max_depth):
+        if self.ordering == "heuristic":
+            self.orderer.cutoff(action, depth, max_depth - depth, board.capture_delta(action)[0])
     
     def find_next_step(self):
         best_action = None
         maximize_value = float('-inf')
         
-        legal_actions = self.root.get_legal_actions()
+        legal_actions = self.order_moves(self.root, 0)
         #print(legal_actions)
-        for action in legal_actions:
-            new_state = NewBoard(self.root._color, self.root._turn, self.root._board)
-            new_state.apply_action(action)
-            value = self._minimax_alpha_beta(new_state, 1, self.max_depth, float('-inf'), float('inf'), False)
+        for i, action in enumerate(legal_actions):
+            # the whole search walks the root board, applying and undoing actions
+            record = self.root.apply(action)
+            if self.search == "pvs":
+                value = self.search_child(self.root, 1, self.max_depth, maximize_value, float('inf'), False, i == 0)
+            else:
+                value = self._minimax_alpha_beta(self.root, 1, self.max_depth, float('-inf'), float('inf'), False)
+            self.root.undo(record)
             if value > maximize_value:
                 maximize_value = value
                 best_action = action
     
         return best_action
 
+    def search_child(self, board: NewBoard, depth, max_depth, alpha, beta, maximizing_player, first):
+        """
+        value of the position after a move, maximizing_player is the side to
+        move in it. In pvs mode only the first move gets the full window
+        """
+        if self.search == "pvs" and not first:
+            window = null_window(alpha, beta, not maximizing_player)
+            if window is not None:
+                value = self._minimax_alpha_beta(board, depth, max_depth, *window, maximizing_player)
+                if value <= alpha or value >= beta:
+                    return value
+        return self._minimax_alpha_beta(board, depth, max_depth, alpha, beta, maximizing_player)
+
     def _minimax_alpha_beta(self, board: NewBoard, depth, max_depth, alpha, beta, maximizing_player):
+        self.nodes += 1
 
         if depth == max_depth or board.is_terminal():
-            return board.evaluation(self.root._color)
+            return board.evaluation(self.root_color)
 
-        legal_actions = board.get_legal_actions()
+        legal_actions = self.order_moves(board, depth)
 
         if maximizing_player:
             max_value = float('-inf')
-            for action in legal_actions:
-                child_node = NewBoard(board._color, board._turn, board._board)
-                child_node.apply_action(action)
-                value = self._minimax_alpha_beta(child_node, depth + 1, max_depth, alpha, beta, False)
+            for i, action in enumerate(legal_actions):
+                record = board.apply(action)
+                value = self.search_child(board, depth + 1, max_depth, alpha, beta, False, i == 0)
+                board.undo(record)
                 if value > max_value:
                     max_value = value
                 alpha = max(alpha, max_value)
                 if beta <= alpha:
+                    self.record_cutoff(board, action, depth, max_depth)
                     break
             return max_value
         else:
             min_value = float('inf')
-            for action in legal_actions:
-                child_node = NewBoard(board._color, board._turn, board._board)
-                child_node.apply_action(action)
-
-                value = self._minimax_alpha_beta(child_node, depth + 1, max_depth, alpha, beta, True)
+            for i, action in enumerate(legal_actions):
+                record = board.apply(action)
+                value = self.search_child(board, depth + 1, max_depth, alpha, beta, True, i == 0)
+                board.undo(record)
                 if value < min_value:
                     min_value = value
                 beta = min(beta, min_value)
                 if beta <= alpha:
+                    self.record_cutoff(board, action, depth, max_depth)
                     break
             return min_value
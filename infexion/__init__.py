@@ -0,0 +1,4 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+from .bitboard import BitBoard
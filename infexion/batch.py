@@ -0,0 +1,146 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Batched child generation. expand() applies every action to a parent
+position at once and returns the successors stacked as one (N, 7, 7) int8
+array in the signed power layout of infexion.evaluate (positive red,
+negative blue), so a whole node's children can be scored and ordered with
+evaluate_batch before any per-child BitBoard or Node is built.
+"""
+
+import numpy as np
+from referee.game.constants import *
+from .bitboard import BitBoard, RED, BLUE
+from .tables import NUM_CELLS, DIRECTIONS, RAYS, action_index
+from .zobrist import ZOBRIST_BLUE, piece_key
+
+# RAY_INDEX[cell, direction] is RAYS as an index array, a spread of power p
+# touches RAY_INDEX[cell, direction, :p]
+RAY_INDEX = np.array(RAYS, dtype=np.intp)
+STEPS = np.arange(MAX_CELL_POWER)
+CELLS = np.arange(NUM_CELLS)
+# SIGNED_KEYS[power + 6, cell] is the Zobrist key of a signed stack, negative
+# powers are blue, 0 an empty cell
+SIGNED_KEYS = np.zeros((2 * MAX_CELL_POWER + 1, NUM_CELLS), dtype=np.uint64)
+for _power in range(1, MAX_CELL_POWER + 1):
+    for _cell in range(NUM_CELLS):
+        SIGNED_KEYS[MAX_CELL_POWER + _power, _cell] = piece_key(_cell, RED, _power)
+        SIGNED_KEYS[MAX_CELL_POWER - _power, _cell] = piece_key(_cell, BLUE, _power)
+
+
+def signed_plane(state: BitBoard) -> np.ndarray:
+    """
+    the position as a flat (49,) int8 array of signed power
+    """
+    plane = np.frombuffer(state.power, dtype=np.uint8).astype(np.int8)
+    blue = np.frombuffer(state.masks[BLUE].to_bytes(7, "little"), dtype=np.uint8)
+    blue = np.unpackbits(blue, bitorder="little")[:NUM_CELLS]
+    plane[blue == 1] *= -1
+    return plane
+
+
+class Successors:
+    """
+    The children of one position. planes[i] is the position after
+    actions[i]. What a BitBoard needs besides the planes (masks, power
+    bytes, keys, power totals) is worked out for the whole batch the first
+    time a child is asked for, so scoring the batch alone never pays for it.
+    """
+    def __init__(self, parent: BitBoard, actions: list, planes: np.ndarray):
+        self.parent = parent
+        self.actions = actions
+        self.planes = planes.reshape(len(actions), BOARD_N, BOARD_N)
+        self._masks = None
+        self._power = None
+        self._keys = None
+        self._powers = None
+        self._cells = None
+
+    def __len__(self):
+        return len(self.actions)
+
+    def _summarise(self):
+        flat = self.planes.reshape(len(self), NUM_CELLS)
+        red = flat > 0
+        blue = flat < 0
+        red_power = np.where(red, flat, 0).sum(axis=1, dtype=np.int32)
+        blue_power = -np.where(blue, flat, 0).sum(axis=1, dtype=np.int32)
+        self._powers = np.stack((red_power, blue_power), axis=1).tolist()
+        self._cells = (red.sum(axis=1), blue.sum(axis=1))
+        keys = np.bitwise_xor.reduce(SIGNED_KEYS[flat + MAX_CELL_POWER, CELLS], axis=1)
+        if self.parent.turn == RED:
+            keys ^= np.uint64(ZOBRIST_BLUE)
+        self._keys = keys.tolist()
+        # both occupancy masks of every child packed to 7 bytes each
+        raw = np.packbits(np.stack((red, blue), axis=1), axis=2, bitorder="little").tobytes()
+        self._masks = [[int.from_bytes(raw[i:i + 7], "little"), int.from_bytes(raw[i + 7:i + 14], "little")]
+                       for i in range(0, len(raw), 14)]
+        self._power = np.abs(flat).tobytes()
+
+    def game_over(self) -> np.ndarray:
+        # BitBoard.game_over for every child
+        turn_count = self.parent.turn_count + 1
+        if turn_count >= MAX_TURNS:
+            return np.ones(len(self), dtype=bool)
+        if turn_count < 2:
+            return np.zeros(len(self), dtype=bool)
+        if self._cells is None:
+            # only the cell counts, the rest of _summarise is not needed
+            flat = self.planes.reshape(len(self), NUM_CELLS)
+            self._cells = ((flat > 0).sum(axis=1), (flat < 0).sum(axis=1))
+        red_cells, blue_cells = self._cells
+        return (red_cells == 0) | (blue_cells == 0)
+
+    def state(self, i: int) -> BitBoard:
+        """
+        child i as a BitBoard, equal to the parent copied with actions[i]
+        applied
+        """
+        if self._keys is None:
+            self._summarise()
+        child = BitBoard.__new__(BitBoard)
+        child.masks = self._masks[i].copy()
+        child.power = bytearray(self._power[i * NUM_CELLS:(i + 1) * NUM_CELLS])
+        child.turn = self.parent.turn ^ 1
+        child.turn_count = self.parent.turn_count + 1
+        child.key = self._keys[i]
+        child.powers = self._powers[i].copy()
+        return child
+
+
+def expand(state: BitBoard, actions: list | None = None) -> Successors:
+    """
+    Apply actions (all legal actions by default) to state in one go. Every
+    child starts as a copy of the parent's plane, spawns set one cell, and
+    spreads clear their origin and add one to the first power cells of
+    their precomputed ray, taking them over and removing stacks that reach
+    7. Actions are not validated, as with BitBoard.apply.
+    """
+    if actions is None:
+        actions = state.legal_actions()
+    count = len(actions)
+    sign = 1 if state.turn == RED else -1
+    base = signed_plane(state)
+    planes = np.repeat(base[np.newaxis], count, axis=0)
+    moves = np.array([action_index(action) for action in actions], dtype=np.intp)
+    rows = np.arange(count)
+
+    spawn = moves < NUM_CELLS
+    planes[rows[spawn], moves[spawn]] = sign
+
+    spread = ~spawn
+    spread_rows = rows[spread]
+    spread_moves = moves[spread] - NUM_CELLS
+    origins = spread_moves // len(DIRECTIONS)
+    rays = RAY_INDEX[origins, spread_moves % len(DIRECTIONS)]
+    # (spread, step) pairs inside the spread's power, flattened to one
+    # (row, target) list. A ray never passes its own origin within 6 steps
+    live = STEPS < np.abs(base[origins])[:, np.newaxis]
+    target_rows = np.broadcast_to(spread_rows[:, np.newaxis], rays.shape)[live]
+    targets = rays[live]
+    new_power = np.abs(base[targets]) + 1
+    new_power[new_power > MAX_CELL_POWER] = 0
+    planes[spread_rows, origins] = 0
+    planes[target_rows, targets] = new_power * sign
+    return Successors(state, actions, planes)
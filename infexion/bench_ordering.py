@@ -0,0 +1,105 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Nodes searched at a fixed depth by the minimax_test and dfs-board searches,
+for the old move ordering, the move orderer, and PVS on top of the orderer.
+Run from the repository root:
+
+    python -m infexion.bench_ordering --depth 3 --positions 8
+"""
+
+import argparse
+import importlib
+import json
+import random
+import time
+import numpy as np
+from .bitboard import BitBoard, RED, BLUE, INDEX_COLOR, iter_bits
+from .bench_parallel import opening_position
+from .tables import NUM_CELLS
+from .tt import TranspositionTable
+
+minimax_test = importlib.import_module("minimax_test.program")
+dfs_board = importlib.import_module("dfs-board.program")
+
+# agent and its search settings, the first one is the baseline
+SEARCHES = [
+    ("minimax_test", [
+        {"ordering": "eval", "search": "alphabeta"},
+        {"ordering": "heuristic", "search": "alphabeta"},
+        {"ordering": "heuristic", "search": "pvs"},
+    ]),
+    ("dfs-board", [
+        {"ordering": "shuffle", "search": "alphabeta"},
+        {"ordering": "heuristic", "search": "alphabeta"},
+        {"ordering": "heuristic", "search": "pvs"},
+    ]),
+]
+
+
+def to_new_board(state: BitBoard):
+    planes = np.zeros((2, NUM_CELLS), dtype=np.int8)
+    for color in (RED, BLUE):
+        for idx in iter_bits(state.masks[color]):
+            planes[dfs_board.OWNER, idx] = dfs_board.OWNER_CODE[INDEX_COLOR[color]]
+    planes[dfs_board.POWER] = np.frombuffer(state.power, dtype=np.uint8)
+    return dfs_board.NewBoard(state.turn_color, dfs_turn(state), planes)
+
+
+def dfs_turn(state: BitBoard) -> int:
+    # dfs-board numbers the turn being played from 1, its agent passes
+    # turn_count + 1 to the search
+    return state.turn_count + 1
+
+
+def search(agent: str, state: BitBoard, depth: int, settings: dict, seed: int) -> tuple[int, float]:
+    """
+    node count and seconds for one fixed depth search
+    """
+    random.seed(seed)
+    start = time.perf_counter()
+    if agent == "minimax_test":
+        minimax = minimax_test.MiniMax(state, state.turn_color, max_depth=depth,
+                                       tt=TranspositionTable(4), time_limit=float("inf"), **settings)
+    else:
+        minimax = dfs_board.MiniMax(to_new_board(state), dfs_turn(state), state.turn_color,
+                                    max_depth=depth, **settings)
+    minimax.find_next_step()
+    return minimax.nodes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--positions", type=int, default=8, help="number of random positions")
+    parser.add_argument("--plies", type=int, default=12, help="random plies before each position")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--agents", nargs="+", default=[agent for agent, _ in SEARCHES])
+    args = parser.parse_args()
+
+    positions = [opening_position(args.plies, args.seed + i) for i in range(args.positions)]
+    for agent, configs in SEARCHES:
+        if agent not in args.agents:
+            continue
+        baseline = None
+        for settings in configs:
+            nodes = seconds = 0
+            for i, state in enumerate(positions):
+                count, elapsed = search(agent, state, args.depth, settings, args.seed + i)
+                nodes += count
+                seconds += elapsed
+            baseline = baseline or nodes
+            print(json.dumps({
+                "agent": agent,
+                **settings,
+                "depth": args.depth,
+                "nodes": nodes,
+                "seconds": seconds,
+                "nodes_per_second": nodes / seconds,
+                "node_ratio": nodes / baseline,
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Iterations per second of the MCTS agent's search for 1 to N worker
+processes in root and leaf parallel mode. Run from the repository root:
+
+    python -m infexion.bench_parallel --workers 8 --iterations 400
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from agent.program import MCTS, ROLLOUT_PLY_CAP, MCTS_NODE_BUDGET, MCTS_WIDENING, MCTS_LEAF_BATCH
+from .bitboard import BitBoard
+
+
+def opening_position(plies: int, seed: int) -> BitBoard:
+    """
+    position reached by a seeded random game of the given length
+    """
+    rng = random.Random(seed)
+    state = BitBoard()
+    for _ in range(plies):
+        state.apply_action(rng.choice(state.legal_actions()))
+    return state
+
+
+def run(state: BitBoard, iterations: int, workers: int, mode: str | None, pool) -> float:
+    # the agent's own rollout cap, tree budget, widening and leaf batch, so
+    # the rates are those of the search it plays
+    mcts = MCTS(state.copy(), state.turn_color, num_iterations=iterations,
+                workers=workers, parallel=mode, pool=pool, rollout_ply_cap=ROLLOUT_PLY_CAP,
+                max_nodes=MCTS_NODE_BUDGET, widening=MCTS_WIDENING, leaf_batch=MCTS_LEAF_BATCH)
+    start = time.perf_counter()
+    # the search prints its own timing line
+    with contextlib.redirect_stdout(io.StringIO()):
+        mcts.search()
+    elapsed = time.perf_counter() - start
+    # leaf mode rounds the iteration count up to a whole batch per worker
+    playouts = mcts.root.visits
+    return playouts / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="largest worker count to try")
+    parser.add_argument("--iterations", type=int, default=200, help="playouts per search")
+    parser.add_argument("--plies", type=int, default=8, help="random plies before the benchmark position")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", default=["root", "leaf"])
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    state = opening_position(args.plies, args.seed)
+    baseline = run(state, args.iterations, 1, None, None)
+    print(json.dumps({"mode": None, "workers": 1, "iterations_per_second": baseline, "speedup": 1.0}))
+    for mode in args.modes:
+        for workers in range(2, args.workers + 1):
+            with ProcessPoolExecutor(workers) as pool:
+                # warm the pool up so process start up is not timed
+                list(pool.map(abs, range(workers)))
+                rate = run(state, args.iterations, workers, mode, pool)
+            print(json.dumps({
+                "mode": mode,
+                "workers": workers,
+                "iterations_per_second": rate,
+                "speedup": rate / baseline,
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Search benchmark over the fixed positions in bench_positions.json, for every
+agent's search. The minimax searches are timed to each depth up to --depth,
+giving time to depth, nodes per second and how often the best move changed
+on the way down. MCTS is timed in four equal slices of --iterations
+playouts, giving rollouts per second and the best move after each slice.
+Prints one JSON line per agent and position, run from the repository root:
+
+    python -m infexion.bench_search --depth 3 --iterations 200 --out bench.jsonl
+    python -m infexion.bench_search --compare bench.jsonl
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import subprocess
+import time
+from referee.game import PlayerColor, Board
+from referee.game.board import CellState
+from .bitboard import BitBoard
+from .bench_ordering import to_new_board, dfs_turn
+from .tables import COORDINATES
+from .tt import TranspositionTable
+
+POSITIONS_PATH = os.path.join(os.path.dirname(__file__), "bench_positions.json")
+AGENTS = ["minimax_test", "minimax", "dfs-board", "agent"]
+MCTS_SLICES = 4
+
+
+def load_positions(path: str = POSITIONS_PATH) -> list[tuple[dict, BitBoard]]:
+    """
+    (entry, position) for every entry of the position file. Cells are
+    [r, q, colour, power], the side to move follows from the turn count
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    positions = []
+    for entry in entries:
+        initial_state = {
+            COORDINATES[r * 7 + q]: CellState(PlayerColor[color], power)
+            for r, q, color, power in entry["cells"]
+        }
+        turn_color = (PlayerColor.RED, PlayerColor.BLUE)[entry["turn_count"] % 2]
+        state = BitBoard.from_board(Board(initial_state, turn_color))
+        state.turn_count = entry["turn_count"]
+        positions.append((entry, state))
+    return positions
+
+
+def stability(moves: list) -> dict:
+    """
+    how many times the best move changed, and from which step on (1 based)
+    it stayed the same
+    """
+    changes = sum(1 for before, after in zip(moves, moves[1:]) if before != after)
+    stable_from = len(moves)
+    while stable_from > 1 and moves[stable_from - 2] == moves[-1]:
+        stable_from -= 1
+    return {"best_move_changes": changes, "stable_from": stable_from}
+
+
+def run_minimax(agent: str, state: BitBoard, depth: int) -> tuple:
+    # fresh search to the given depth, returns (best move, nodes)
+    module = importlib.import_module(f"{agent}.program")
+    color = state.turn_color
+    if agent == "minimax_test":
+        minimax = module.MiniMax(state, color, max_depth=depth, tt=TranspositionTable(4),
+                                 time_limit=float("inf"))
+        action = minimax.find_next_step()
+        # quiescence positions are searched too, count them like the agent does
+        return action, minimax.nodes + minimax.quiescence_nodes
+    if agent == "minimax":
+        minimax = module.MiniMax(state.copy(), color, max_depth=depth, time_limit=float("inf"))
+        action = minimax.find_next_step()
+        # the tree builder and the search only count their nodes on the deadline
+        return action, minimax.deadline.nodes
+    minimax = module.MiniMax(to_new_board(state), dfs_turn(state), color, max_depth=depth, search="pvs")
+    return minimax.find_next_step(), minimax.nodes
+
+
+def bench_minimax(agent: str, state: BitBoard, max_depth: int, seed: int) -> dict:
+    """
+    One search per depth. minimax_test and minimax deepen iteratively, so
+    each run's time is the time to reach that depth; dfs-board searches the
+    given depth only.
+    """
+    depths = []
+    for depth in range(1, max_depth + 1):
+        random.seed(seed)
+        start = time.perf_counter()
+        action, nodes = run_minimax(agent, state, depth)
+        seconds = time.perf_counter() - start
+        depths.append({"depth": depth, "seconds": seconds, "nodes": nodes, "move": str(action)})
+    nodes = sum(entry["nodes"] for entry in depths)
+    seconds = sum(entry["seconds"] for entry in depths)
+    return {
+        "depths": depths,
+        "nodes_per_second": nodes / seconds,
+        **stability([entry["move"] for entry in depths]),
+    }
+
+
+def bench_mcts(state: BitBoard, iterations: int, seed: int) -> dict:
+    """
+    the agent's MCTS settings, searched in MCTS_SLICES calls on one tree
+    """
+    module = importlib.import_module("agent.program")
+    random.seed(seed)
+    per_slice = max(1, iterations // MCTS_SLICES)
+    mcts = module.MCTS(state.copy(), state.turn_color, num_iterations=per_slice,
+                       rollout_ply_cap=module.ROLLOUT_PLY_CAP, max_nodes=module.MCTS_NODE_BUDGET,
+                       widening=module.MCTS_WIDENING)
+    slices = []
+    seconds = 0.0
+    for _ in range(MCTS_SLICES):
+        start = time.perf_counter()
+        action = mcts.search()
+        seconds += time.perf_counter() - start
+        slices.append({"rollouts": mcts.root.visits, "seconds": seconds, "move": str(action)})
+    return {
+        "slices": slices,
+        "rollouts_per_second": mcts.root.visits / seconds,
+        "nodes": mcts.node_count,
+        **stability([entry["move"] for entry in slices]),
+    }
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rate(result: dict) -> float:
+    return result.get("nodes_per_second") or result.get("rollouts_per_second")
+
+
+def compare(base_path: str, results: list[dict]):
+    # speed of every (agent, position) against the same entry of an earlier run
+    with open(base_path) as f:
+        base = {(entry["agent"], entry["position"]): entry for entry in map(json.loads, f)}
+    for result in results:
+        old = base.get((result["agent"], result["position"]))
+        if old is not None:
+            print(json.dumps({
+                "agent": result["agent"],
+                "position": result["position"],
+                "base_commit": old["commit"],
+                "speedup": rate(result) / rate(old),
+                "same_move": result["move"] == old["move"],
+            }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", nargs="+", default=AGENTS)
+    parser.add_argument("--positions", nargs="+", help="position names, all by default")
+    parser.add_argument("--depth", type=int, default=3, help="deepest minimax search")
+    parser.add_argument("--iterations", type=int, default=200, help="MCTS playouts per position")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the results here")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    revision = commit()
+    results = []
+    for entry, state in load_positions():
+        if args.positions and entry["name"] not in args.positions:
+            continue
+        for agent in args.agents:
+            # the searches print as they go
+            with contextlib.redirect_stdout(io.StringIO()):
+                if agent == "agent":
+                    result = bench_mcts(state, args.iterations, args.seed)
+                    move = result["slices"][-1]["move"]
+                else:
+                    result = bench_minimax(agent, state, args.depth, args.seed)
+                    move = result["depths"][-1]["move"]
+            result = {"commit": revision, "agent": agent, "position": entry["name"],
+                      "phase": entry["phase"], "move": move, **result}
+            results.append(result)
+            print(json.dumps(result))
+    if args.out:
+        with open(args.out, "w") as f:
+            f.writelines(json.dumps(result) + "\n" for result in results)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
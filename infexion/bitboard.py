@@ -0,0 +1,323 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+from referee.game import \
+    PlayerColor, Action, SpawnAction, SpreadAction, HexPos, Board
+from referee.game.board import CellState
+from referee.game.constants import *
+from referee.game.exceptions import *
+from .zobrist import ZOBRIST, ZOBRIST_BLUE, piece_key
+from .tables import NUM_CELLS, DIRECTION_INDEX, COORDINATES, RAYS, \
+    SPAWN_ACTIONS, SPREAD_ACTIONS, cell_index
+
+# colours are stored as plain ints inside the bitboard
+RED = 0
+BLUE = 1
+COLOR_INDEX = {
+    PlayerColor.RED: RED,
+    PlayerColor.BLUE: BLUE
+}
+INDEX_COLOR = (PlayerColor.RED, PlayerColor.BLUE)
+
+
+def iter_bits(mask: int):
+    """
+    yield the index of every set bit in mask, lowest first
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitBoard:
+    """
+    Compact Infexion game state. Each colour has an occupancy bitmask over
+    the 49 cells and the powers are packed into one bytearray, so copying a
+    position is two ints and a 49 byte copy instead of a deepcopy of Board.
+    Results of apply_action, game_over and winner_color match referee Board.
+    key is the Zobrist hash of the position, kept up to date by every move.
+    powers holds each colour's running total power, so power checks and the
+    evaluation are O(1); cell counts are popcounts of the masks.
+    """
+    __slots__ = ("masks", "power", "turn", "turn_count", "key", "powers")
+
+    def __init__(self, turn: int = RED):
+        self.masks = [0, 0]
+        self.power = bytearray(NUM_CELLS)
+        self.turn = turn
+        self.turn_count = 0
+        self.key = ZOBRIST_BLUE if turn == BLUE else 0
+        self.powers = [0, 0]
+
+    @classmethod
+    def from_board(cls, board: Board) -> 'BitBoard':
+        bitboard = cls(COLOR_INDEX[board._turn_color])
+        bitboard.turn_count = board.turn_count
+        for cell, state in board._state.items():
+            if state.power > 0:
+                idx = cell_index(cell)
+                bitboard.masks[COLOR_INDEX[state.player]] |= 1 << idx
+                bitboard.power[idx] = state.power
+                bitboard.powers[COLOR_INDEX[state.player]] += state.power
+        bitboard.key = bitboard.compute_key()
+        return bitboard
+
+    def compute_key(self) -> int:
+        """
+        Zobrist key from scratch, the moves keep self.key in step with this
+        """
+        key = ZOBRIST_BLUE if self.turn == BLUE else 0
+        for color in (RED, BLUE):
+            for idx in iter_bits(self.masks[color]):
+                key ^= piece_key(idx, color, self.power[idx])
+        return key
+
+    def to_board(self) -> Board:
+        """
+        Board has no way to take a turn count, so the returned board starts
+        with an empty history
+        """
+        initial_state = {}
+        for color in (RED, BLUE):
+            for idx in iter_bits(self.masks[color]):
+                initial_state[COORDINATES[idx]] = CellState(INDEX_COLOR[color], self.power[idx])
+        return Board(initial_state, INDEX_COLOR[self.turn])
+
+    def copy(self) -> 'BitBoard':
+        other = BitBoard.__new__(BitBoard)
+        other.masks = self.masks.copy()
+        other.power = self.power[:]
+        other.turn = self.turn
+        other.turn_count = self.turn_count
+        other.key = self.key
+        other.powers = self.powers.copy()
+        return other
+
+    __copy__ = copy
+
+    def restore(self, other: 'BitBoard'):
+        """
+        overwrite this board in place with the position held by other
+        """
+        self.masks[RED], self.masks[BLUE] = other.masks
+        self.power[:] = other.power
+        self.turn = other.turn
+        self.turn_count = other.turn_count
+        self.key = other.key
+        self.powers[RED], self.powers[BLUE] = other.powers
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __getitem__(self, cell: HexPos):
+        idx = cell_index(cell)
+        if self.masks[RED] >> idx & 1:
+            return PlayerColor.RED, self.power[idx]
+        if self.masks[BLUE] >> idx & 1:
+            return PlayerColor.BLUE, self.power[idx]
+        return None, 0
+
+    @property
+    def turn_color(self) -> PlayerColor:
+        return INDEX_COLOR[self.turn]
+
+    @property
+    def occupied(self) -> int:
+        return self.masks[RED] | self.masks[BLUE]
+
+    def color_power(self, color: PlayerColor) -> int:
+        return self.powers[COLOR_INDEX[color]]
+
+    def color_cells(self, color: PlayerColor) -> int:
+        return self.masks[COLOR_INDEX[color]].bit_count()
+
+    @property
+    def total_power(self) -> int:
+        return self.powers[RED] + self.powers[BLUE]
+
+    @property
+    def game_over(self) -> bool:
+        if self.turn_count >= MAX_TURNS:
+            return True
+        # same as the referee, nobody can lose before both players moved
+        if self.turn_count < 2:
+            return False
+        return self.masks[RED] == 0 or self.masks[BLUE] == 0
+
+    @property
+    def winner_color(self) -> PlayerColor | None:
+        if not self.game_over:
+            return None
+        red_power = self.color_power(PlayerColor.RED)
+        blue_power = self.color_power(PlayerColor.BLUE)
+        if abs(red_power - blue_power) < WIN_POWER_DIFF:
+            return None
+        return (PlayerColor.RED, PlayerColor.BLUE)[red_power < blue_power]
+
+    def spawn(self, idx: int):
+        self.masks[self.turn] |= 1 << idx
+        self.power[idx] = 1
+        self.powers[self.turn] += 1
+        self.key ^= ZOBRIST[(idx * 2 + self.turn) * 7 + 1] ^ ZOBRIST_BLUE
+        self.turn ^= 1
+        self.turn_count += 1
+
+    def spread(self, idx: int, direction: int):
+        masks = self.masks
+        power = self.power
+        powers = self.powers
+        color = self.turn
+        opp = color ^ 1
+        steps = power[idx]
+        key = self.key ^ ZOBRIST[(idx * 2 + color) * 7 + steps] ^ ZOBRIST_BLUE
+        masks[color] &= ~(1 << idx)
+        power[idx] = 0
+        # the origin's power is spent, each target gains one and captured
+        # stacks move over to the spreading colour
+        powers[color] -= steps
+        for target in RAYS[idx][direction][:steps]:
+            bit = 1 << target
+            old_power = power[target]
+            new_power = old_power + 1
+            # take the old stack out of the key, empty cells xor in 0
+            if masks[opp] & bit:
+                key ^= ZOBRIST[(target * 2 + opp) * 7 + old_power]
+                masks[opp] &= ~bit
+                powers[opp] -= old_power
+            else:
+                key ^= ZOBRIST[(target * 2 + color) * 7 + old_power]
+                powers[color] -= old_power
+            if new_power > MAX_CELL_POWER:
+                # a stack reaching 7 is removed from the board
+                masks[color] &= ~bit
+                power[target] = 0
+            else:
+                masks[color] |= bit
+                power[target] = new_power
+                powers[color] += new_power
+                key ^= ZOBRIST[(target * 2 + color) * 7 + new_power]
+        self.key = key
+        self.turn ^= 1
+        self.turn_count += 1
+
+    def apply_action(self, action: Action):
+        match action:
+            case SpawnAction(cell):
+                idx = cell_index(cell)
+                if self.total_power >= MAX_TOTAL_POWER:
+                    raise IllegalActionException(
+                        f"Total board power max reached ({MAX_TOTAL_POWER})", self.turn_color)
+                if self.occupied >> idx & 1:
+                    raise IllegalActionException(f"Cell {cell} occupied", self.turn_color)
+                self.spawn(idx)
+            case SpreadAction(cell, direction):
+                idx = cell_index(cell)
+                if not self.masks[self.turn] >> idx & 1:
+                    raise IllegalActionException(
+                        "Only the player's own cells can be spread", self.turn_color)
+                self.spread(idx, DIRECTION_INDEX[direction])
+            case _:
+                raise IllegalActionException(f"Unknown action {action}", self.turn_color)
+
+    def apply(self, action: Action) -> tuple:
+        """
+        Apply a legal action in place and return an undo record. The record
+        keeps both masks, the key, both power totals and the old power of
+        every cell the action touched (the spread origin and up to six
+        targets), which is all undo needs.
+        Unlike apply_action the action is not validated.
+        """
+        masks = self.masks
+        power = self.power
+        old_red, old_blue = masks
+        old_key = self.key
+        old_red_power, old_blue_power = self.powers
+        match action:
+            case SpawnAction(cell):
+                idx = cell_index(cell)
+                changed = (idx, 0)
+                self.spawn(idx)
+            case SpreadAction(cell, direction):
+                idx = cell_index(cell)
+                direction = DIRECTION_INDEX[direction]
+                changed = [idx, power[idx]]
+                for target in RAYS[idx][direction][:power[idx]]:
+                    changed += (target, power[target])
+                self.spread(idx, direction)
+        return old_red, old_blue, old_key, old_red_power, old_blue_power, changed
+
+    def undo(self, record: tuple):
+        """
+        take back the action that produced record, must be the last one applied
+        """
+        old_red, old_blue, old_key, old_red_power, old_blue_power, changed = record
+        masks = self.masks
+        masks[RED] = old_red
+        masks[BLUE] = old_blue
+        self.key = old_key
+        self.powers[RED] = old_red_power
+        self.powers[BLUE] = old_blue_power
+        power = self.power
+        for i in range(0, len(changed), 2):
+            power[changed[i]] = changed[i + 1]
+        self.turn ^= 1
+        self.turn_count -= 1
+
+    def capture_delta(self, action: Action) -> tuple[bool, int]:
+        """
+        Cheap static look at an action for move ordering: whether it takes
+        over any opponent stack, and how much it changes (own power - opponent
+        power) for the side to move. Nothing is applied.
+        """
+        match action:
+            case SpawnAction():
+                return False, 1
+            case SpreadAction(cell, direction):
+                idx = cell_index(cell)
+                power = self.power
+                opp_mask = self.masks[self.turn ^ 1]
+                steps = power[idx]
+                capture = False
+                delta = -steps
+                for target in RAYS[idx][DIRECTION_INDEX[direction]][:steps]:
+                    old_power = power[target]
+                    if opp_mask >> target & 1:
+                        capture = True
+                        # the opponent loses the stack, we get it back one higher
+                        delta += old_power + (old_power + 1 if old_power < MAX_CELL_POWER else 0)
+                    elif old_power == MAX_CELL_POWER:
+                        delta -= MAX_CELL_POWER
+                    else:
+                        delta += 1
+                return capture, delta
+
+    def spawn_actions(self) -> list[SpawnAction]:
+        empty = ~self.occupied & ((1 << NUM_CELLS) - 1)
+        return [SPAWN_ACTIONS[idx] for idx in iter_bits(empty)]
+
+    def spread_actions(self) -> list[SpreadAction]:
+        spreads = []
+        for idx in iter_bits(self.masks[self.turn]):
+            spreads += SPREAD_ACTIONS[idx]
+        return spreads
+
+    def legal_move_mask(self) -> int:
+        """
+        legal moves as one int with a bit per move index (see infexion.tables),
+        bit cell for a spawn and bit 49 + cell * 6 + direction for a spread
+        """
+        mask = 0
+        for idx in iter_bits(self.masks[self.turn]):
+            mask |= 0b111111 << (NUM_CELLS + idx * 6)
+        if self.total_power < MAX_TOTAL_POWER:
+            mask |= ~self.occupied & ((1 << NUM_CELLS) - 1)
+        return mask
+
+    def legal_actions(self) -> list[Action]:
+        """
+        spreads first, spawns are only legal below the total power cap
+        """
+        if self.total_power >= MAX_TOTAL_POWER:
+            return self.spread_actions()
+        return self.spread_actions() + self.spawn_actions()
@@ -0,0 +1,156 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Opening book: the move for every early position worth storing, found
+offline by a deep search and looked up by canonical position key.
+
+The file is a header (magic, entry count, number of plies covered) then
+entries of (canonical key, move index in the canonical frame) sorted by
+key, so the reader can binary search it straight off a memory map. Build it
+from the repository root with:
+
+    python -m infexion.book --plies 3 --depth 3
+"""
+
+import argparse
+import importlib
+import mmap
+import os
+import random
+import struct
+import time
+from .bitboard import BitBoard
+from .symmetry import canonical, map_move, unmap_move
+from .tables import ACTIONS, action_index
+
+BOOK_PATH = os.path.join(os.path.dirname(__file__), "opening.book")
+MAGIC = b"IXBK"
+HEADER = struct.Struct("<4sII")
+ENTRY = struct.Struct("<QH")
+
+
+class OpeningBook:
+    """
+    Read only view of a book file. The file is memory mapped, so opening a
+    book costs nothing until the first lookup, and a missing or unreadable
+    file gives an empty book, so agents can always ask it first.
+    """
+    def __init__(self, path: str = BOOK_PATH):
+        self.data = None
+        self.count = 0
+        self.plies = 0
+        try:
+            with open(path, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        magic, count, plies = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or len(data) != HEADER.size + count * ENTRY.size:
+            data.close()
+            return
+        self.data, self.count, self.plies = data, count, plies
+
+    def __len__(self):
+        return self.count
+
+    def probe(self, key: int) -> int | None:
+        """
+        stored move index for a canonical key, or None
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_key, move = ENTRY.unpack_from(self.data, HEADER.size + mid * ENTRY.size)
+            if entry_key == key:
+                return move
+            if entry_key < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def lookup(self, state: BitBoard):
+        """
+        book action for state, or None when it is out of the book
+        """
+        if state.turn_count >= self.plies:
+            return None
+        key, t = canonical(state)
+        move = self.probe(key)
+        if move is None:
+            return None
+        return ACTIONS[unmap_move(move, t)]
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+def write_book(path: str, entries: dict[int, int], plies: int):
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(entries), plies))
+        for key in sorted(entries):
+            file.write(ENTRY.pack(key, entries[key]))
+
+
+def build(plies: int, depth: int, seed: int = 0, log=print) -> dict[int, int]:
+    """
+    Search every position either side can meet in the first plies plies
+    while it follows the book, one per symmetry class. That is the start
+    position and every first reply, then after each book move every answer
+    the opponent can give, and so on.
+    """
+    searcher = importlib.import_module("minimax_test.program")
+    random.seed(seed)
+    entries = {}
+    # positions still to search, keyed by canonical key
+    frontier = {}
+    start = BitBoard()
+    frontier[canonical(start)[0]] = start
+    for action in start.legal_actions():
+        child = start.copy()
+        child.apply_action(action)
+        frontier.setdefault(canonical(child)[0], child)
+
+    while frontier:
+        key, state = frontier.popitem()
+        if key in entries or state.turn_count >= plies or state.game_over:
+            continue
+        started = time.perf_counter()
+        minimax = searcher.MiniMax(state, state.turn_color, max_depth=depth,
+                                   time_limit=float("inf"), search="pvs")
+        action = minimax.find_next_step()
+        entries[key] = map_move(action_index(action), canonical(state)[1])
+        log(f"ply {state.turn_count} {action} {time.perf_counter() - started:.2f}s")
+
+        # the opponent's answers to the book move
+        after = state.copy()
+        after.apply_action(action)
+        if after.game_over:
+            continue
+        for reply in after.legal_actions():
+            child = after.copy()
+            child.apply_action(reply)
+            child_key = canonical(child)[0]
+            if child_key not in entries:
+                frontier.setdefault(child_key, child)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the opening book.")
+    parser.add_argument("--plies", type=int, default=3, help="book positions have fewer plies played than this")
+    parser.add_argument("--depth", type=int, default=3, help="search depth per position")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=BOOK_PATH)
+    args = parser.parse_args()
+
+    entries = build(args.plies, args.depth, args.seed)
+    write_book(args.out, entries, args.plies)
+    print(f"{len(entries)} positions written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Exact solver for positions with few stacks left. It searches depth first
+with iterative deepening and only ever returns proven results: WIN, DRAW or
+LOSS for the side to move, or None when nothing could be proven in the time
+given. A result is proven once every line it depends on reaches the end of
+the game, either by a colour losing all its stacks or by the 343 turn limit.
+"""
+
+from referee.game.constants import *
+from .timing import Deadline, SearchTimeout, move_budget
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+RESULT_NAMES = {WIN: "win", DRAW: "draw", LOSS: "loss", None: "unknown"}
+
+# the solver's own table is cleared once it holds this many positions
+MAX_ENTRIES = 1 << 20
+# share of the move's time the solver gets when an agent tries it
+ENDGAME_SHARE = 0.5
+
+
+class EndgameSolver:
+    """
+    Kept by the agent for the whole game, so results proven while solving one
+    move are still there for the next. Both tables are keyed by (Zobrist key,
+    turn count): the same position nearer the turn limit can have a
+    different result, and along any line the turn count is fixed by the
+    depth, so transpositions within a search still hit.
+    proven maps a position to (result, best action), searched to the deepest
+    search that could not prove it.
+    """
+    def __init__(self, max_tokens: int = 6, max_power: int = 10, min_turn: int = 8):
+        self.max_tokens = max_tokens
+        self.max_power = max_power
+        self.min_turn = min_turn
+        self.proven = {}
+        self.searched = {}
+        self.nodes = 0
+        self.depth = 0
+        self.deadline = None
+        # seconds the last solve() took, for the caller's own budget
+        self.seconds = 0.0
+
+    def applies(self, state) -> bool:
+        """
+        whether state is small enough to try solving, both few stacks and
+        little power. Total power only grows by spawning, so it alone holds
+        in every opening; early positions with few stacks are nowhere near
+        solvable either, hence min_turn
+        """
+        if state.turn_count < self.min_turn:
+            return False
+        return state.occupied.bit_count() <= self.max_tokens and state.total_power <= self.max_power
+
+    def solve(self, state, time_limit: float = 0.4):
+        """
+        (result, action) for the side to move in state, deepening until the
+        result is proven, the turn limit is reached or time runs out. action
+        is None when nothing was proven or the game is already over
+        """
+        self.nodes = 0
+        self.depth = 0
+        self.deadline = Deadline(time_limit)
+        self.seconds = 0.0
+        if state.game_over:
+            return self._result(state), None
+        if len(self.proven) + len(self.searched) > MAX_ENTRIES:
+            self.proven.clear()
+            self.searched.clear()
+        board = state.copy()
+        result = None
+        try:
+            for depth in range(1, MAX_TURNS - state.turn_count + 1):
+                self.depth = depth
+                result = self._solve(board, depth)
+                if result is not None:
+                    break
+        except SearchTimeout:
+            pass
+        self.seconds = self.deadline.elapsed()
+        if result is None:
+            return None, None
+        return result, self.proven[(state.key, state.turn_count)][1]
+
+    def _result(self, state) -> int:
+        # same rule as winner_color, seen from the side to move
+        own = state.powers[state.turn]
+        opp = state.powers[state.turn ^ 1]
+        if abs(own - opp) < WIN_POWER_DIFF:
+            return DRAW
+        return WIN if own > opp else LOSS
+
+    def _ordered(self, state):
+        # captures first, best change in power first, so wins are found early
+        actions = state.legal_actions()
+        return sorted(actions, key=lambda action: state.capture_delta(action), reverse=True)
+
+    def _solve(self, state, depth: int):
+        self.nodes += 1
+        self.deadline.tick()
+        if state.game_over:
+            return self._result(state)
+        key = (state.key, state.turn_count)
+        hit = self.proven.get(key)
+        if hit is not None:
+            return hit[0]
+        if depth == 0 or self.searched.get(key, 0) >= depth:
+            return None
+        best = None
+        best_action = None
+        unknown = False
+        for action in self._ordered(state):
+            record = state.apply(action)
+            result = self._solve(state, depth - 1)
+            state.undo(record)
+            if result is None:
+                unknown = True
+                continue
+            if best is None or -result > best:
+                best = -result
+                best_action = action
+                if best == WIN:
+                    break
+        # a win needs one winning reply, anything else needs every reply known
+        if best == WIN or (best is not None and not unknown):
+            self.proven[key] = (best, best_action)
+            return best
+        self.searched[key] = depth
+        return None
+
+    def report(self, result) -> str:
+        return f"endgame {RESULT_NAMES[result]} at depth {self.depth} after {self.nodes} nodes"
+
+
+def book_or_endgame_move(agent, state, referee: dict):
+    """
+    The move an agent plays without searching in state (a BitBoard of the
+    game): its opening book move, or a proven endgame win or draw. None when
+    the agent's own search should play. The agent needs book, endgame (an
+    EndgameSolver), nodes and stats. A proven loss is left to the search,
+    which still plays for the opponent's mistakes; the time the solver used
+    is left in agent.endgame.seconds for the search to take off its budget.
+    """
+    agent.nodes = 0
+    agent.endgame.seconds = 0.0
+    book_action = agent.book.lookup(state)
+    if book_action is not None:
+        return book_action
+    if not agent.endgame.applies(state):
+        return None
+    time_limit = move_budget(referee.get("time_remaining"), state.turn_count)
+    result, action = agent.endgame.solve(state, time_limit * ENDGAME_SHARE)
+    print(f"Testing: {agent.endgame.report(result)}")
+    agent.nodes = agent.endgame.nodes
+    if agent.stats is not None:
+        agent.stats.set(endgame=RESULT_NAMES[result], depth=agent.endgame.depth)
+        agent.stats.count("nodes", agent.endgame.nodes)
+    if result in (WIN, DRAW):
+        return action
+    return None
@@ -0,0 +1,38 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import numpy as np
+from referee.game import PlayerColor
+from referee.game.constants import *
+
+# same weights as the agents' evaluation functions: power counts 2, cells 1,
+# and power goes up to 3 once this many cells are counted
+ENDGAME_THRESHOLD = int(0.5 * (7 * 7))  # 50% of the total board size
+
+
+def evaluate_batch(planes: np.ndarray, root_color: PlayerColor, opp_cell_weight: int = 1,
+                   endgame_threshold: int | None = ENDGAME_THRESHOLD) -> np.ndarray:
+    """
+    Score K positions at once from root_color's point of view. planes is a
+    (K, 7, 7) int8 tensor of signed power, positive for red stacks and
+    negative for blue ones, as made by infexion.batch.expand. This is the
+    agents' evaluation, power_weight * power_score + cell_score with
+    power_weight switching from 2 to 3 at ENDGAME_THRESHOLD cells, in a
+    handful of array reductions. opp_cell_weight is how much each opponent
+    cell counts (minimax_test counts them twice). With endgame_threshold
+    None power always counts 2, as in minimax's evaluation.
+    """
+    own = planes.reshape(len(planes), -1).astype(np.int32)
+    if root_color == PlayerColor.BLUE:
+        own = -own
+    mine = own > 0
+    theirs = own < 0
+    power_score = own.sum(axis=1)
+    self_cells = mine.sum(axis=1)
+    opp_cells = theirs.sum(axis=1) * opp_cell_weight
+    total_cells = self_cells + opp_cells
+    if endgame_threshold is None:
+        power_weight = 2
+    else:
+        power_weight = np.where(total_cells >= endgame_threshold, 3, 2)
+    return power_weight * power_score + (self_cells - opp_cells)
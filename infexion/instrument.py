@@ -0,0 +1,134 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Per move search statistics and profiling. Both are off unless switched on
+from the environment, so real games can be measured without editing code:
+
+    INFEXION_STATS=moves.jsonl python -m referee minimax_test agent
+    INFEXION_PROFILE=profiles python -m referee minimax_test agent
+
+INFEXION_STATS names a file ("-" for stderr) that every agent appends one
+JSON line per move to: counters (nodes, quiescence nodes, cutoffs, TT
+hits, misses and collisions, evals, rollouts), timers (move generation,
+copying, rollouts), how often a kept MCTS tree was reused, and the depth
+reached and time used. When it is unset the agents hand their searches None
+instead of a SearchStats, and every hook is skipped after one test.
+
+INFEXION_PROFILE names a directory. Every Agent.action then runs under
+cProfile, and one cumulative profile per agent is written there after
+each move, to be read with pstats.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+
+STATS_PATH = os.environ.get("INFEXION_STATS")
+PROFILE_DIR = os.environ.get("INFEXION_PROFILE")
+
+
+class SearchStats:
+    """
+    Counters and timers for the move being played. The agent's action is
+    wrapped by instrumented(), which writes them out after every move and
+    starts over.
+    """
+    def __init__(self, agent: str, path: str = STATS_PATH):
+        self.agent = agent
+        self.path = path
+        self.counters = {}
+        self.timers = {}
+        self.fields = {}
+        self.start = time.perf_counter()
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def lap(self, name: str, start: float) -> float:
+        """
+        add the time since start to timer name, returns now so the next
+        phase can be timed from here
+        """
+        now = time.perf_counter()
+        self.timers[name] = self.timers.get(name, 0.0) + now - start
+        return now
+
+    def set(self, **fields):
+        # values that are not summed, like the depth reached
+        self.fields.update(fields)
+
+    def maximum(self, name: str, value):
+        self.fields[name] = max(value, self.fields.get(name, value))
+
+    def begin(self):
+        self.counters = {}
+        self.timers = {}
+        self.fields = {}
+        self.start = time.perf_counter()
+
+    def emit(self, **fields):
+        record = {
+            "agent": self.agent,
+            **fields,
+            **self.fields,
+            "seconds": time.perf_counter() - self.start,
+            **self.counters,
+            "timers": self.timers,
+        }
+        line = json.dumps(record)
+        if self.path == "-":
+            print(line, file=sys.stderr)
+        else:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+def move_stats(agent: str) -> SearchStats | None:
+    """
+    a SearchStats for the agent when INFEXION_STATS is set, None otherwise.
+    Agents keep it as self.stats for the whole game and pass it to their
+    searches, which skip every hook when it is None
+    """
+    return SearchStats(agent) if STATS_PATH else None
+
+
+_profiles = {}
+
+
+def instrumented(action):
+    """
+    Decorator for Agent.action. Writes out the agent's stats after every
+    move and runs the move under cProfile when INFEXION_PROFILE is set. With
+    both switched off the method is returned as it is.
+    """
+    if not STATS_PATH and not PROFILE_DIR:
+        return action
+
+    @functools.wraps(action)
+    def wrapper(agent, **referee):
+        stats = getattr(agent, "stats", None)
+        if stats is not None:
+            stats.begin()
+        if PROFILE_DIR:
+            name = f"{type(agent).__module__}-{agent._color.name.lower()}-{os.getpid()}"
+            profile = _profiles.get(name)
+            if profile is None:
+                profile = _profiles[name] = cProfile.Profile()
+            profile.enable()
+            try:
+                result = action(agent, **referee)
+            finally:
+                profile.disable()
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                profile.dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+        else:
+            result = action(agent, **referee)
+        if stats is not None:
+            stats.emit(color=agent._color.name, turn=getattr(agent.game_state, "turn_count", None),
+                       action=str(result))
+        return result
+    return wrapper
@@ -0,0 +1,37 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import sys
+from .bitboard import BitBoard
+
+
+def state_bytes(state: BitBoard) -> int:
+    return (sys.getsizeof(state) + sys.getsizeof(state.masks) + sys.getsizeof(state.power)
+            + sys.getsizeof(state.powers) + sum(sys.getsizeof(mask) for mask in state.masks)
+            + sys.getsizeof(state.key))
+
+
+def tree_memory(root) -> dict:
+    """
+    Nodes and bytes held by the tree under root. Counts each node object and
+    the lists it owns, plus every board kept by a node (a board shared by many
+    nodes counts once). Actions are interned and children are counted as
+    nodes, so neither is counted again as a list element.
+    """
+    nodes = 0
+    total = 0
+    seen_states = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        total += sys.getsizeof(node)
+        for name in type(node).__slots__:
+            value = getattr(node, name, None)
+            if isinstance(value, list):
+                total += sys.getsizeof(value)
+            elif isinstance(value, BitBoard) and id(value) not in seen_states:
+                seen_states.add(id(value))
+                total += state_bytes(value)
+        stack.extend(node.children)
+    return {"nodes": nodes, "bytes": total, "bytes_per_node": total / nodes}
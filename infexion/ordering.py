@@ -0,0 +1,79 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+from referee.game import SpawnAction
+from .tables import ACTION_INDEX, INTERNED_INDEX, NUM_MOVES, action_index
+
+# killer slots kept per ply
+NUM_KILLERS = 2
+
+
+class MoveOrderer:
+    """
+    Orders the moves of one search, in this order:
+      1. the transposition table's best move
+      2. captures (spreads that take over opponent stacks), best static
+         delta first
+      3. the killer moves stored for this ply
+      4. everything else by history score, ties keep generation order
+    The static delta comes from the board's capture_delta(action), which
+    both BitBoard and dfs-board's NewBoard provide, so any search over either
+    board can plug this in. Call cutoff() whenever a move causes a cutoff.
+    """
+    def __init__(self):
+        # killers[ply] holds move indices, most recent first
+        self.killers = {}
+        # history[side][move index], side is 0 for the player to move at the
+        # root and 1 for the other
+        self.history = [[0] * NUM_MOVES, [0] * NUM_MOVES]
+
+    def order(self, state, actions, ply: int, tt_move=None):
+        """
+        yield the actions best first. Stages are built lazily, so a cutoff on
+        an early move skips the sorting of the later stages
+        """
+        tt_index = action_index(tt_move) if tt_move is not None else -1
+        indices = []
+        captures = []
+        for action in actions:
+            index = INTERNED_INDEX.get(id(action))
+            if index is None:
+                index = ACTION_INDEX[action]
+            if index == tt_index:
+                yield action
+                continue
+            indices.append((index, action))
+            if not isinstance(action, SpawnAction):
+                is_capture, delta = state.capture_delta(action)
+                if is_capture:
+                    captures.append((delta, index, action))
+        captures.sort(key=lambda item: item[0], reverse=True)
+        for _, _, action in captures:
+            yield action
+
+        done = {index for _, index, _ in captures}
+        killers = self.killers.get(ply, ())
+        for killer in killers:
+            for index, action in indices:
+                if index == killer and index not in done:
+                    done.add(index)
+                    yield action
+                    break
+        history = self.history[ply & 1]
+        quiet = [(history[index], action) for index, action in indices if index not in done]
+        quiet.sort(key=lambda item: item[0], reverse=True)
+        for _, action in quiet:
+            yield action
+
+    def cutoff(self, action, ply: int, depth: int, is_capture: bool = False):
+        """
+        remember a move that caused a cutoff at ply with depth left to search
+        """
+        index = action_index(action)
+        self.history[ply & 1][index] += depth * depth
+        if is_capture:
+            return
+        killers = self.killers.setdefault(ply, [])
+        if index not in killers:
+            killers.insert(0, index)
+            del killers[NUM_KILLERS:]
@@ -0,0 +1,88 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import random
+from referee.game import PlayerColor
+from referee.game.constants import *
+from .bitboard import BitBoard, INDEX_COLOR, RED, BLUE
+from .tables import RAYS, NUM_CELLS
+
+FULL_MASK = (1 << NUM_CELLS) - 1
+
+
+def nth_bit(mask: int, n: int) -> int:
+    """
+    index of the n-th (from 0) lowest set bit of mask
+    """
+    for _ in range(n):
+        mask &= mask - 1
+    return (mask & -mask).bit_length() - 1
+
+
+def playout(state: BitBoard, ply_cap: int | None = None, rng: random.Random = random) -> PlayerColor | None:
+    """
+    Uniformly random playout from state, returning the winner's colour (None
+    for a draw) so it can go straight to backpropagate. The game runs on
+    local ints and one bytearray: a move is drawn as an index into
+    "6 spreads per own cell, then the empty cells" and decoded with bit
+    tricks, so no action objects or lists are built and state is left
+    untouched. With a ply cap the position at the cutoff is adjudicated the
+    way the referee ends a game at the turn limit, by the power difference.
+    """
+    masks = state.masks.copy()
+    power = state.power[:]
+    turn = state.turn
+    turn_count = state.turn_count
+    total = sum(power)
+    end = MAX_TURNS if ply_cap is None else min(MAX_TURNS, turn_count + ply_cap)
+    rand = rng.random
+
+    while turn_count < end:
+        if turn_count >= 2 and (masks[RED] == 0 or masks[BLUE] == 0):
+            break
+        own = masks[turn]
+        num_spreads = own.bit_count() * 6
+        if total < MAX_TOTAL_POWER:
+            empty = ~(masks[RED] | masks[BLUE]) & FULL_MASK
+            num_moves = num_spreads + empty.bit_count()
+        else:
+            num_moves = num_spreads
+        choice = int(rand() * num_moves)
+
+        if choice < num_spreads:
+            idx = nth_bit(own, choice // 6)
+            opp = turn ^ 1
+            steps = power[idx]
+            total -= steps
+            masks[turn] = own & ~(1 << idx)
+            power[idx] = 0
+            for target in RAYS[idx][choice % 6][:steps]:
+                bit = 1 << target
+                masks[opp] &= ~bit
+                if power[target] == MAX_CELL_POWER:
+                    # the stack reaches 7 and is removed
+                    masks[turn] &= ~bit
+                    power[target] = 0
+                    total -= MAX_CELL_POWER
+                else:
+                    masks[turn] |= bit
+                    power[target] += 1
+                    total += 1
+        else:
+            idx = nth_bit(empty, choice - num_spreads)
+            masks[turn] = own | (1 << idx)
+            power[idx] = 1
+            total += 1
+        turn ^= 1
+        turn_count += 1
+
+    red_power = 0
+    mask = masks[RED]
+    while mask:
+        low = mask & -mask
+        red_power += power[low.bit_length() - 1]
+        mask ^= low
+    blue_power = total - red_power
+    if abs(red_power - blue_power) < WIN_POWER_DIFF:
+        return None
+    return INDEX_COLOR[RED] if red_power > blue_power else INDEX_COLOR[BLUE]
@@ -0,0 +1,45 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+INF = float('inf')
+
+# half width of the first aspiration window. Scores swing between odd and
+# even depths, narrower windows failed more often than they saved
+ASPIRATION_WINDOW = 8
+# failed windows double in size this many times before going to infinity
+ASPIRATION_TRIES = 3
+
+
+def aspiration_search(search, guess, window=ASPIRATION_WINDOW):
+    """
+    Run search(alpha, beta) -> (value, action) in a window around guess, the
+    previous iteration's score. A result on or outside a bound is only a
+    bound, so that side of the window is widened and the search repeated.
+    """
+    if guess is None or guess in (INF, -INF):
+        return search(-INF, INF)
+    tries = 0
+    alpha, beta = guess - window, guess + window
+    while True:
+        value, action = search(alpha, beta)
+        fail_low = value <= alpha and alpha != -INF
+        fail_high = value >= beta and beta != INF
+        if not fail_low and not fail_high:
+            return value, action
+        tries += 1
+        window *= 2
+        if fail_low:
+            alpha = guess - window if tries < ASPIRATION_TRIES else -INF
+        if fail_high:
+            beta = guess + window if tries < ASPIRATION_TRIES else INF
+
+
+def null_window(alpha, beta, maximizing_player):
+    """
+    zero width window just above alpha (max node) or below beta (min node),
+    for proving a move is no better than the current best. None while that
+    bound is still infinite, the move then needs a full search anyway
+    """
+    if maximizing_player:
+        return None if alpha == -INF else (alpha, alpha + 1)
+    return None if beta == INF else (beta - 1, beta)
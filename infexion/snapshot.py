@@ -0,0 +1,168 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Binary snapshots of a search tree, in place of printing it. Agents write one
+per move only when INFEXION_SNAPSHOTS names a directory, so inspecting the
+tree costs nothing during play.
+
+A file is a header (magic, version, turn count, Zobrist key of the root
+position, node count) then one fixed size record per node of (parent index,
+move index, visits, value), with the root first and the rest in breadth
+first order. Every node's children are then one run of records, and the
+parent column never decreases, so the reader finds a node's children by
+binary search on it. Read a snapshot from the repository root with:
+
+    python -m infexion.snapshot snapshots/agent-1234-041.tree --depth 2 --top 5
+"""
+
+import argparse
+import bisect
+import math
+import os
+import struct
+from collections import deque
+import numpy as np
+from .tables import ACTIONS, action_index
+
+SNAPSHOT_DIR = os.environ.get("INFEXION_SNAPSHOTS")
+MAGIC = b"IXTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQI")
+NODE = struct.Struct("<iHIf")
+NODE_DTYPE = np.dtype([("parent", "<i4"), ("move", "<u2"), ("visits", "<u4"), ("value", "<f4")])
+NO_MOVE = 0xFFFF
+# records are written out in chunks of this many
+CHUNK = 4096
+
+
+def mcts_fields(node) -> tuple[int, float]:
+    return node.visits, node.wins
+
+
+def no_fields(node) -> tuple[int, float]:
+    # for trees that keep no statistics, only their shape is written
+    return 0, math.nan
+
+
+def write_tree(path: str, root, state, fields=mcts_fields, max_depth: int | None = None) -> int:
+    """
+    Write the tree under root, whose position is state, to path and return
+    the number of nodes written. fields(node) gives a node's (visits, value).
+    The tree is walked breadth first with a queue and written in chunks, so
+    neither the tree depth nor its size matters.
+    """
+    count = 0
+    chunk = []
+    # (node, parent index, depth)
+    queue = deque([(root, -1, 0)])
+    with open(path, "wb") as f:
+        # the count is filled in once the tree has been walked
+        f.write(HEADER.pack(MAGIC, VERSION, state.turn_count, state.key, 0))
+        while queue:
+            node, parent, depth = queue.popleft()
+            visits, value = fields(node)
+            # a re-rooted tree keeps the move that led to its root, it is not written
+            move = NO_MOVE if parent < 0 or node.action is None else action_index(node.action)
+            chunk.append(NODE.pack(parent, move, visits, value))
+            if max_depth is None or depth < max_depth:
+                queue.extend((child, count, depth + 1) for child in node.children)
+            count += 1
+            if len(chunk) == CHUNK:
+                f.write(b"".join(chunk))
+                chunk.clear()
+        f.write(b"".join(chunk))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, state.turn_count, state.key, count))
+    return count
+
+
+def snapshot(agent: str, root, state, fields=mcts_fields) -> str | None:
+    """
+    write a snapshot of the tree for this move into SNAPSHOT_DIR, nothing
+    when it is unset. Returns the file written
+    """
+    if not SNAPSHOT_DIR:
+        return None
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(SNAPSHOT_DIR, f"{agent}-{os.getpid()}-{state.turn_count:03d}.tree")
+    write_tree(path, root, state, fields)
+    return path
+
+
+class TreeSnapshot:
+    """
+    Read only view of a snapshot file. The records are memory mapped and
+    only read when a query touches them.
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            magic, version, turn_count, key, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a tree snapshot")
+        self.turn_count = turn_count
+        self.key = key
+        self.count = count
+        self.records = np.memmap(path, dtype=NODE_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+        self.parents = self.records["parent"]
+
+    def __len__(self):
+        return self.count
+
+    def node(self, index: int) -> dict:
+        parent, move, visits, value = self.records[index].tolist()
+        return {
+            "index": index,
+            "parent": parent,
+            "action": None if move == NO_MOVE else str(ACTIONS[move]),
+            "visits": visits,
+            "value": value,
+        }
+
+    def children(self, index: int) -> range:
+        # the parent column is sorted, children are the run equal to index
+        first = bisect.bisect_left(self.parents, index)
+        return range(first, bisect.bisect_right(self.parents, index, lo=first))
+
+    def path(self, index: int) -> list[str]:
+        """
+        actions from the root down to the node
+        """
+        actions = []
+        while index > 0:
+            actions.append(self.node(index)["action"])
+            index = int(self.parents[index])
+        return actions[::-1]
+
+    def top(self, index: int, k: int, key: str = "visits") -> list[dict]:
+        nodes = [self.node(child) for child in self.children(index)]
+        nodes.sort(key=lambda node: node[key], reverse=True)
+        return nodes[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--node", type=int, default=0, help="node to start from, 0 is the root")
+    parser.add_argument("--depth", type=int, default=1, help="levels below the node to show")
+    parser.add_argument("--top", type=int, default=10, help="children shown per node")
+    parser.add_argument("--sort", choices=["visits", "value"], default="visits")
+    args = parser.parse_args()
+
+    tree = TreeSnapshot(args.path)
+    print(f"{len(tree)} nodes, turn {tree.turn_count}, root key {tree.key:016x}")
+    print("path:", " ".join(tree.path(args.node)) or "root")
+    # (node, depth), shown depth first without recursion
+    stack = [(tree.node(args.node), 0)]
+    while stack:
+        node, depth = stack.pop()
+        rate = node["value"] / node["visits"] if node["visits"] else math.nan
+        print(f"{'  ' * depth}{node['action'] or 'root'} #{node['index']} "
+              f"visits {node['visits']} value {node['value']:g} rate {rate:.3f} "
+              f"children {len(tree.children(node['index']))}")
+        if depth < args.depth:
+            stack.extend((child, depth + 1) for child in reversed(tree.top(node["index"], args.top, args.sort)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Symmetries of the 7x7 torus. The board looks the same after any of the 49
+translations and any of the 12 rotations and reflections of the hex grid,
+588 transforms in all. Every transform maps cells to cells and directions
+to directions, so a spread in one position is the same spread in the
+transformed one.
+
+A position is folded onto its canonical form and moves are carried
+between the two frames with map_move and unmap_move. The canonical form is
+the smallest Zobrist key among the transforms that send a stack of the
+rarest (colour, power) class to cell 0. Equivalent positions have the same
+set of such transformed positions, so they get the same canonical form,
+and only 12 transforms per stack of that class are tried instead of 588.
+"""
+
+import numpy as np
+from referee.game.constants import *
+from .bitboard import RED, BLUE, iter_bits
+from .tables import NUM_CELLS, DIRECTIONS
+from .zobrist import ZOBRIST, ZOBRIST_BLUE
+
+NUM_TRANSLATIONS = NUM_CELLS
+
+# the 12 linear maps of the hex grid in (r, q) coordinates as (a, b, c, d),
+# taking (r, q) to (a*r + b*q, c*r + d*q). Rotating by 60 degrees is
+# (r, q) -> (-q, r + q), reflecting swaps r and q. Both have determinant
+# +-1, so they stay one to one modulo 7.
+def _point_maps():
+    rotations = [(1, 0, 0, 1)]
+    for _ in range(5):
+        a, b, c, d = rotations[-1]
+        rotations.append((-c, -d, a + c, b + d))
+    reflections = [(c, d, a, b) for a, b, c, d in rotations]
+    return rotations + reflections
+
+
+POINT_MAPS = _point_maps()
+NUM_POINT_MAPS = len(POINT_MAPS)
+
+
+def _direction_map(matrix):
+    a, b, c, d = matrix
+    vectors = [(direction.r, direction.q) for direction in DIRECTIONS]
+    return tuple(vectors.index((a * r + b * q, c * r + d * q)) for r, q in vectors)
+
+
+def _cell_map(matrix, dr, dq):
+    a, b, c, d = matrix
+    return tuple(
+        (a * r + b * q + dr) % BOARD_N * BOARD_N + (c * r + d * q + dq) % BOARD_N
+        for r in range(BOARD_N)
+        for q in range(BOARD_N)
+    )
+
+
+# transform t = point map * 49 + translation: the point map is applied about
+# cell 0 and then the board is shifted by the translation cell. t = 0 is the
+# identity
+CELL_MAPS = [
+    _cell_map(matrix, dr, dq)
+    for matrix in POINT_MAPS
+    for dr in range(BOARD_N)
+    for dq in range(BOARD_N)
+]
+DIRECTION_MAPS = [_direction_map(matrix) for matrix in POINT_MAPS]
+NUM_TRANSFORMS = len(CELL_MAPS)
+
+
+# a transform is fixed by where it sends the cells
+TRANSFORM_INDEX = {cell_map: t for t, cell_map in enumerate(CELL_MAPS)}
+
+
+def _inverses():
+    inverses = []
+    for cell_map in CELL_MAPS:
+        inverse = [0] * NUM_CELLS
+        for cell, image in enumerate(cell_map):
+            inverse[image] = cell
+        inverses.append(TRANSFORM_INDEX[tuple(inverse)])
+    return inverses
+
+
+# INVERSE[t] is the transform that undoes t
+INVERSE = _inverses()
+
+
+def compose(s: int, t: int) -> int:
+    """
+    the transform that applies t and then s
+    """
+    cell_map = CELL_MAPS[s]
+    return TRANSFORM_INDEX[tuple(cell_map[image] for image in CELL_MAPS[t])]
+
+# array copies for canonical, which scores all its candidates in one go
+_CELL_MAPS = np.array(CELL_MAPS, dtype=np.intp)
+_ZOBRIST = np.array(ZOBRIST, dtype=np.uint64)
+
+
+def transform_key(state, t: int) -> int:
+    """
+    Zobrist key of state after transform t, without building the position
+    """
+    cell_map = CELL_MAPS[t]
+    power = state.power
+    key = ZOBRIST_BLUE if state.turn == BLUE else 0
+    for color in (RED, BLUE):
+        for idx in iter_bits(state.masks[color]):
+            key ^= ZOBRIST[cell_map[idx] * 14 + color * 7 + power[idx]]
+    return key
+
+
+def _anchors(state):
+    # the occupied cells, each one's offset into its Zobrist block, and the
+    # cells of the rarest (colour, power) class. Class sizes survive every
+    # transform, so the choice of class does too
+    power = state.power
+    cells = []
+    offsets = []
+    classes = {}
+    for color in (RED, BLUE):
+        for idx in iter_bits(state.masks[color]):
+            offset = color * 7 + power[idx]
+            cells.append(idx)
+            offsets.append(offset)
+            classes.setdefault(offset, []).append(idx)
+    if not cells:
+        return cells, offsets, []
+    anchors = min(classes.items(), key=lambda item: (len(item[1]), item[0]))[1]
+    return cells, offsets, anchors
+
+
+def _sending(g: int, cell: int, target: int) -> int:
+    # the transform with point map g that sends cell to target
+    r, q = divmod(CELL_MAPS[g * NUM_TRANSLATIONS][cell], BOARD_N)
+    tr, tq = divmod(target, BOARD_N)
+    return g * NUM_TRANSLATIONS + (tr - r) % BOARD_N * BOARD_N + (tq - q) % BOARD_N
+
+
+# ANCHORED[g, cell] is the transform with point map g sending cell to cell 0
+ANCHORED = np.array([
+    [_sending(g, cell, 0) for cell in range(NUM_CELLS)]
+    for g in range(NUM_POINT_MAPS)
+], dtype=np.intp)
+
+
+def canonical(state) -> tuple[int, int]:
+    """
+    (key, t) of the canonical form of state, t being the transform that maps
+    state onto it
+    """
+    cells, offsets, anchors = _anchors(state)
+    base = ZOBRIST_BLUE if state.turn == BLUE else 0
+    if not cells:
+        return base, 0
+    candidates = ANCHORED[:, anchors].ravel()
+    # keys[i] is the key of the position after candidates[i]
+    moved = _CELL_MAPS[candidates][:, np.array(cells)] * 14 + np.array(offsets)
+    keys = np.bitwise_xor.reduce(_ZOBRIST[moved], axis=1)
+    keys ^= np.uint64(base)
+    best = int(np.argmin(keys))
+    return int(keys[best]), int(candidates[best])
+
+
+def stabilizer(state) -> list[int]:
+    """
+    transforms that leave state unchanged, the identity included
+    """
+    cells, offsets, anchors = _anchors(state)
+    if not cells:
+        return list(range(NUM_TRANSFORMS))
+    key = state.key
+    # a symmetry sends the first anchor onto one of the anchors
+    found = []
+    for g in range(NUM_POINT_MAPS):
+        for cell in anchors:
+            t = _sending(g, anchors[0], cell)
+            if transform_key(state, t) == key:
+                found.append(t)
+    return found
+
+
+def map_move(move: int, t: int) -> int:
+    """
+    move index in state's frame to the same move after transform t
+    """
+    cell_map = CELL_MAPS[t]
+    if move < NUM_CELLS:
+        return cell_map[move]
+    cell, direction = divmod(move - NUM_CELLS, 6)
+    return NUM_CELLS + cell_map[cell] * 6 + DIRECTION_MAPS[t // NUM_TRANSLATIONS][direction]
+
+
+def unmap_move(move: int, t: int) -> int:
+    """
+    move index after transform t back to state's frame
+    """
+    return map_move(move, INVERSE[t])
+
+
+def unique_moves(state, moves) -> list[int]:
+    """
+    moves of state, in their original order, keeping one of every set of
+    moves the symmetries of state map onto each other (they lead to
+    equivalent positions). Nothing is dropped for a position with no
+    symmetry but the identity
+    """
+    symmetries = stabilizer(state)
+    if len(symmetries) == 1:
+        return list(moves)
+    return [move for move in moves if all(map_move(move, s) >= move for s in symmetries)]
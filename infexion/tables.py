@@ -0,0 +1,68 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Move generation tables, built once at import. Cells are indexed
+r * 7 + q and directions by their position in DIRECTIONS. Every action
+has a move index: 0-48 spawn on that cell, 49 + cell * 6 + direction a
+spread.
+"""
+
+from referee.game import SpawnAction, SpreadAction, HexPos, HexDir
+from referee.game.constants import *
+
+NUM_CELLS = BOARD_N * BOARD_N
+DIRECTIONS = [HexDir.Down, HexDir.DownLeft, HexDir.DownRight, HexDir.Up, HexDir.UpLeft, HexDir.UpRight]
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+NUM_MOVES = NUM_CELLS + NUM_CELLS * len(DIRECTIONS)
+
+COORDINATES = [
+    HexPos(r, q)
+    for r in range(BOARD_N)
+    for q in range(BOARD_N)
+]
+
+
+def cell_index(cell: HexPos) -> int:
+    return cell.r * BOARD_N + cell.q
+
+
+def _build_rays():
+    # rays[cell][direction] lists the cells a spread from cell passes
+    # through, wrapping around the torus, for steps 1 to 6
+    rays = []
+    for cell in COORDINATES:
+        cell_rays = []
+        for direction in DIRECTIONS:
+            ray = []
+            pos = cell
+            for _ in range(MAX_CELL_POWER):
+                pos = pos + direction
+                ray.append(cell_index(pos))
+            cell_rays.append(tuple(ray))
+        rays.append(tuple(cell_rays))
+    return tuple(rays)
+
+
+RAYS = _build_rays()
+
+# one shared action object per move, generation hands these out instead of
+# building new ones
+SPAWN_ACTIONS = tuple(SpawnAction(cell) for cell in COORDINATES)
+SPREAD_ACTIONS = tuple(
+    tuple(SpreadAction(cell, direction) for direction in DIRECTIONS)
+    for cell in COORDINATES
+)
+ACTIONS = SPAWN_ACTIONS + tuple(action for actions in SPREAD_ACTIONS for action in actions)
+ACTION_INDEX = {action: i for i, action in enumerate(ACTIONS)}
+# the same by object identity, hashing an int is much cheaper than hashing
+# the action dataclass, and only works for the shared objects above
+INTERNED_INDEX = {id(action): i for i, action in enumerate(ACTIONS)}
+
+
+def action_index(action) -> int:
+    """
+    move index of any spawn or spread, interned or not
+    """
+    index = INTERNED_INDEX.get(id(action))
+    return ACTION_INDEX[action] if index is None else index
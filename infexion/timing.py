@@ -0,0 +1,53 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import time
+from referee.game.constants import *
+
+
+class SearchTimeout(TimeoutError):
+    """
+    raised from inside a search when its deadline has passed
+    """
+
+
+class Deadline:
+    """
+    Wall clock budget for one search. tick() is called once per node and only
+    reads the clock every check_every nodes, raising SearchTimeout once the
+    budget is used up so the search can unwind mid-iteration.
+    """
+    def __init__(self, budget: float, check_every: int = 32):
+        self.start = time.perf_counter()
+        self.end = self.start + budget
+        self.check_every = check_every
+        self.countdown = check_every
+        self.nodes = 0
+
+    def tick(self):
+        self.nodes += 1
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.countdown = self.check_every
+            if time.perf_counter() >= self.end:
+                raise SearchTimeout("search deadline reached")
+
+    def expired(self) -> bool:
+        return time.perf_counter() >= self.end
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
+def move_budget(time_remaining: float | None, turn_count: int, default: float = 0.8,
+                reserve: float = 0.05, min_budget: float = 0.01) -> float:
+    """
+    Seconds to spend on this move. The remaining game clock (the referee's
+    time_remaining) is split evenly across the moves we can still be asked
+    for before the 343 turn limit, holding back a small reserve. Without a
+    clock the default budget is used.
+    """
+    if time_remaining is None:
+        return default
+    moves_left = max(1, (MAX_TURNS - turn_count + 1) // 2)
+    return max(min_budget, time_remaining * (1 - reserve) / moves_left)
@@ -0,0 +1,197 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+Self-play tournament between agent packages, replacing run_multiple.sh. The
+agents are imported and played in-process, several games at a time on a
+process pool, and every game is written out as one JSONL line or CSV row.
+Run from the repository root:
+
+    python -m infexion.tournament --pairs minimax_test:minimax agent:minimax_test \
+        --games 20 --workers 4 --out results.jsonl
+"""
+
+import argparse
+import contextlib
+import csv
+import importlib
+import io
+import json
+import random
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from referee.game import PlayerColor, Board
+from referee.game.constants import *
+from referee.game.exceptions import IllegalActionException
+
+# game clock per player in seconds, the same as the referee's default
+TIME_LIMIT = 180.0
+SPACE_LIMIT = 250.0
+_SWITCH_COLOR = {
+    PlayerColor.RED: PlayerColor.BLUE,
+    PlayerColor.BLUE: PlayerColor.RED
+}
+CSV_FIELDS = ["game", "red", "blue", "seed", "winner", "reason", "turns",
+              "red_time", "blue_time", "red_max_move", "blue_max_move", "red_nodes", "blue_nodes"]
+
+
+def play_game(game: int, red: str, blue: str, seed: int, time_limit: float = TIME_LIMIT,
+              max_turns: int = MAX_TURNS) -> dict:
+    """
+    Play one game between the Agent classes of the red and blue packages.
+    Like the referee, only the player whose turn it is gets asked for an
+    action, an illegal action or running out of clock loses the game, and
+    the game stops at the turn limit. An exception from an agent's action()
+    or turn() loses too. Agent output is swallowed.
+    """
+    random.seed(seed)
+    board = Board()
+    names = {PlayerColor.RED: red, PlayerColor.BLUE: blue}
+    clocks = {color: 0.0 for color in PlayerColor}
+    moves = []
+    winner = None
+    reason = "turn_limit"
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        agents = {
+            color: importlib.import_module(f"{name}.program").Agent(
+                color, time_remaining=time_limit, space_remaining=SPACE_LIMIT)
+            for color, name in names.items()
+        }
+        while not board.game_over and board.turn_count < max_turns:
+            color = board.turn_color
+            agent = agents[color]
+            start = time.perf_counter()
+            try:
+                action = agent.action(time_remaining=time_limit - clocks[color],
+                                      space_remaining=SPACE_LIMIT)
+            except Exception:
+                winner, reason = _SWITCH_COLOR[color], "error"
+                moves.append({"color": color.name, "error": traceback.format_exc()})
+                break
+            seconds = time.perf_counter() - start
+            clocks[color] += seconds
+            moves.append({
+                "color": color.name,
+                "action": str(action),
+                "seconds": seconds,
+                # agents that count their search leave the last count here
+                "nodes": getattr(agent, "nodes", None),
+            })
+            if clocks[color] > time_limit:
+                winner, reason = _SWITCH_COLOR[color], "timeout"
+                break
+            try:
+                board.apply_action(action)
+            except IllegalActionException:
+                winner, reason = _SWITCH_COLOR[color], "illegal"
+                break
+            failed = None
+            for other_color, other in agents.items():
+                try:
+                    other.turn(color, action, time_remaining=time_limit - clocks[other_color],
+                               space_remaining=SPACE_LIMIT)
+                except Exception:
+                    # an agent that cannot take in a move loses, as in action()
+                    failed = other_color
+                    moves.append({"color": other_color.name, "error": traceback.format_exc()})
+                    break
+            if failed is not None:
+                winner, reason = _SWITCH_COLOR[failed], "error"
+                break
+        else:
+            winner = board.winner_color
+            if board.game_over and board.turn_count < MAX_TURNS:
+                reason = "win"
+    result = {
+        "game": game,
+        "red": red,
+        "blue": blue,
+        "seed": seed,
+        "winner": winner.name if winner is not None else None,
+        "reason": reason,
+        "turns": board.turn_count,
+    }
+    for color in PlayerColor:
+        own = [move for move in moves if move["color"] == color.name and "seconds" in move]
+        nodes = [move["nodes"] for move in own if move["nodes"] is not None]
+        prefix = color.name.lower()
+        result[f"{prefix}_time"] = clocks[color]
+        result[f"{prefix}_max_move"] = max((move["seconds"] for move in own), default=0.0)
+        result[f"{prefix}_nodes"] = sum(nodes) if nodes else None
+    result["moves"] = moves
+    return result
+
+
+def schedule(pairs: list[tuple[str, str]], games: int, seed: int, swap: bool):
+    """
+    (game, red, blue, seed) for every game to play, games per pair, each pair
+    also played with colours swapped when swap is set
+    """
+    jobs = []
+    for red, blue in pairs:
+        orders = [(red, blue), (blue, red)] if swap and red != blue else [(red, blue)]
+        for first, second in orders:
+            for _ in range(games):
+                jobs.append((len(jobs), first, second, seed + len(jobs)))
+    return jobs
+
+
+class ResultWriter:
+    """
+    writes results as they arrive, JSONL with every move or CSV with one row
+    of totals per game, picked by the file extension
+    """
+    def __init__(self, path: str):
+        self.file = open(path, "w", newline="")
+        self.csv = None
+        if path.endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, CSV_FIELDS, extrasaction="ignore")
+            self.csv.writeheader()
+
+    def write(self, result: dict):
+        if self.csv is not None:
+            self.csv.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pairs", nargs="+", default=["minimax_test:minimax_test"],
+                        help="red:blue agent packages")
+    parser.add_argument("--games", type=int, default=10, help="games per pair and colour order")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game, the rest count up")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--swap", action="store_true", help="also play every pair with colours swapped")
+    parser.add_argument("--time", type=float, default=TIME_LIMIT, help="clock per player in seconds")
+    parser.add_argument("--max-turns", type=int, default=MAX_TURNS)
+    parser.add_argument("--out", default="results.jsonl", help=".jsonl or .csv")
+    args = parser.parse_args()
+
+    pairs = [tuple(pair.split(":")) for pair in args.pairs]
+    jobs = schedule(pairs, args.games, args.seed, args.swap)
+    writer = ResultWriter(args.out)
+    wins = {}
+    with ProcessPoolExecutor(args.workers) as pool:
+        futures = [pool.submit(play_game, *job, args.time, args.max_turns) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            writer.write(result)
+            winner = result[result["winner"].lower()] if result["winner"] else None
+            key = (result["red"], result["blue"], winner)
+            wins[key] = wins.get(key, 0) + 1
+            print(f"game {result['game']}: {result['red']} v {result['blue']}, "
+                  f"{result['winner']} ({result['reason']}) after {result['turns']} turns")
+    writer.close()
+    for (red, blue, winner), count in sorted(wins.items(), key=str):
+        print(json.dumps({"red": red, "blue": blue, "winner": winner, "games": count}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+# bound types stored with each score
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# rough size of one stored entry (tuple, key and score objects), used to turn
+# the memory cap into a number of slots
+ENTRY_BYTES = 128
+
+
+class TranspositionTable:
+    """
+    Fixed size transposition table keyed by Zobrist key. Each bucket has two
+    slots: a depth-preferred slot that only gives way to an equal or deeper
+    search of a new position, and an always-replace slot for everything else.
+    Entries are (key, depth, flag, score, move) tuples.
+    """
+    def __init__(self, size_mb: float = 16):
+        buckets = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_BYTES))
+        # round down to a power of two so the bucket is a mask of the key
+        self.num_buckets = 1 << (buckets.bit_length() - 1)
+        self.mask = self.num_buckets - 1
+        self.slots = [None] * (2 * self.num_buckets)
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def probe(self, key: int):
+        """
+        return the entry stored for key, or None
+        """
+        index = (key & self.mask) << 1
+        slots = self.slots
+        for entry in (slots[index], slots[index + 1]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        if slots[index] is not None or slots[index + 1] is not None:
+            # the bucket holds other positions that share the index bits
+            self.collisions += 1
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: float, move):
+        index = (key & self.mask) << 1
+        slots = self.slots
+        entry = (key, depth, flag, score, move)
+        deep = slots[index]
+        if deep is None or deep[0] == key or depth >= deep[1]:
+            if deep is not None and deep[0] != key:
+                # keep the replaced position around in the other slot
+                slots[index + 1] = deep
+            slots[index] = entry
+        else:
+            slots[index + 1] = entry
+        self.stores += 1
+
+    def stats(self) -> dict:
+        probes = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "slots": len(self.slots),
+        }
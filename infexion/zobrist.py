@@ -0,0 +1,29 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+import random
+from referee.game.constants import *
+
+# fixed seed so every process (and anything saved to disk keyed by position)
+# agrees on the keys
+_rng = random.Random(30024)
+
+# one key per (cell, colour, power), laid out flat as
+# ZOBRIST[(cell * 2 + colour) * 7 + power]. The power 0 entries are 0 so an
+# empty cell can be xored in and out without a branch.
+ZOBRIST = [
+    _rng.getrandbits(64) if power else 0
+    for cell in range(BOARD_N * BOARD_N)
+    for color in range(2)
+    for power in range(MAX_CELL_POWER + 1)
+]
+
+# xored in whenever blue is the side to move
+ZOBRIST_BLUE = _rng.getrandbits(64)
+
+
+def piece_key(cell: int, color: int, power: int) -> int:
+    """
+    key for a stack of the given colour (0 red, 1 blue) and power on cell
+    """
+    return ZOBRIST[(cell * 2 + color) * (MAX_CELL_POWER + 1) + power]
@@ -2,9 +2,17 @@
 # Project Part B: Game Playing Agent
 
 from referee.game import \
-    PlayerColor, Action, SpawnAction, SpreadAction, HexPos, HexDir, Board
+    PlayerColor, Action, SpawnAction, SpreadAction, HexPos
 from referee.game.constants import *
-from copy import deepcopy
+from infexion.bitboard import BitBoard
+from infexion.batch import expand
+from infexion.evaluate import evaluate_batch
+from infexion.book import OpeningBook
+from infexion.endgame import EndgameSolver, book_or_endgame_move
+from infexion.snapshot import snapshot
+from infexion.instrument import instrumented, move_stats
+from infexion.timing import Deadline, SearchTimeout, move_budget
+from infexion.search import aspiration_search, null_window
 import random
 import time
 _SWITCH_COLOR = {
@@ -30,25 +38,39 @@ class Agent:
         Initialise the agent.
         """
         self._color = color
-        self.game_state = Board()
+        self.game_state = BitBoard()
         self.node_explore = []
         self.time_taken = []
+        # nodes searched for the last move
+        self.nodes = 0
+        self.book = OpeningBook()
+        self.endgame = EndgameSolver()
+        self.stats = move_stats("minimax")
         match color:
             case PlayerColor.RED:
                 print("Testing: I am playing as red")
             case PlayerColor.BLUE:
                 print("Testing: I am playing as blue")
 
+    @instrumented
     def action(self, **referee: dict) -> Action:
         """
         Return the next action to take.
         """
+        quick_action = book_or_endgame_move(self, self.game_state, referee)
+        if quick_action is not None:
+            return quick_action
         match self._color:
             case PlayerColor.RED:
                 starttime = time.time()
-                minimax = MiniMax(self.game_state, PlayerColor.RED, max_depth=1)
-                minimax.generate_tree()
+                time_limit = move_budget(referee.get("time_remaining"), self.game_state.turn_count,
+                                         default=5) - self.endgame.seconds
+                minimax = MiniMax(self.game_state, PlayerColor.RED, max_depth=1, time_limit=time_limit)
                 best_action = minimax.find_next_step()
+                self.nodes += minimax.deadline.nodes
+                if self.stats is not None:
+                    self.stats.set(depth=minimax.completed_depth)
+                    self.stats.count("nodes", minimax.deadline.nodes)
                 endtime = time.time()
                 print('time costs this round = ', endtime - starttime)
                 actions = minimax.root.get_legal_actions()
@@ -57,10 +79,15 @@ class Agent:
             case PlayerColor.BLUE:
                 # This is going to be invalid... BLUE never spawned!
                 starttime = time.time()
-                minimax = MiniMax(self.game_state, PlayerColor.BLUE, max_depth=2)
-                minimax.generate_tree()
-                #total_nodes = minimax.print_tree()
+                time_limit = move_budget(referee.get("time_remaining"), self.game_state.turn_count,
+                                         default=5) - self.endgame.seconds
+                minimax = MiniMax(self.game_state, PlayerColor.BLUE, max_depth=2, time_limit=time_limit)
                 best_action = minimax.find_next_step()
+                self.nodes += minimax.deadline.nodes
+                snapshot("minimax", minimax.root, self.game_state, lambda node: (0, node.evaluation()))
+                if self.stats is not None:
+                    self.stats.set(depth=minimax.completed_depth)
+                    self.stats.count("nodes", minimax.deadline.nodes)
                 endtime = time.time()
                 #self.node_explore.append(total_nodes)
                 self.time_taken.append(endtime - starttime)
@@ -85,46 +112,47 @@ class Agent:
                 pass
 
 class Node:
-    def __init__(self, state: Board, color: PlayerColor, level: int, parent = None, action = None) -> None:
+    def __init__(self, state: BitBoard | None, color: PlayerColor, level: int, parent = None, action = None,
+                 batch = None, score = None, terminal = None) -> None:
         self.color = color
-        self.state = state
+        self._state = state
         self.parent = parent
         self.action = action
         self.children = []
         self.level = level
+        # nodes made by generate_tree come from a batch of successors as
+        # (Successors, index), already scored, and only build their BitBoard
+        # when something asks for it
+        self.batch = batch
+        self.score = score
+        self.terminal = terminal
+
+    @property
+    def state(self) -> BitBoard:
+        if self._state is None:
+            successors, index = self.batch
+            self._state = successors.state(index)
+        return self._state
 
     def add_child(self, child):
         self.children.append(child)
 
     def is_terminal_node(self):
-        return self.state.game_over
+        if self.terminal is None:
+            self.terminal = self.state.game_over
+        return self.terminal
     
     def get_legal_actions(self):
-        actions = []
-        directions = [HexDir.Down, HexDir.DownLeft, HexDir.DownRight, HexDir.Up, HexDir.UpLeft, HexDir.UpRight]
-        for cor in COORDINATES:
-            if self.state._cell_occupied(cor):
-                cellColor, cellPower = self.state[cor]
-                if cellColor == self.color:
-                    for direction in directions:
-                        actions.append(SpreadAction(cor, direction))
-            else:
-                actions.append(SpawnAction(cor))
-        return actions
+        # no spawns at the power cap, expand() does not check
+        return self.state.legal_actions()
     
     def evaluation(self):
-        red_power = 0
-        blue_power = 0
-        red_cells = 0
-        blue_cells = 0
-
-        for cell in self.state._state.values():
-            if cell.player == PlayerColor.BLUE:
-                blue_power += cell.power
-                blue_cells += 1
-            elif cell.player == PlayerColor.RED:
-                red_power += cell.power
-                red_cells += 1
+        if self.score is not None:
+            return self.score
+        red_power = self.state.color_power(PlayerColor.RED)
+        blue_power = self.state.color_power(PlayerColor.BLUE)
+        red_cells = self.state.color_cells(PlayerColor.RED)
+        blue_cells = self.state.color_cells(PlayerColor.BLUE)
 
         power_score = blue_power - red_power
         cell_score = blue_cells - red_cells
@@ -136,11 +164,23 @@ class Node:
 
     
 class MiniMax:
-    def __init__(self, root_state, curr_color, max_depth = 3):
+    def __init__(self, root_state, curr_color, max_depth = 3, time_limit = 5, search = "alphabeta"):
         self.root = Node(root_state, curr_color, level=0)
         self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.deadline = None
+        self.completed_depth = 0
+        # "alphabeta" searches every move in the full window, "pvs" proves the
+        # moves after the first with null windows and runs each iteration in
+        # an aspiration window around the previous score
+        self.search = search
     
     def generate_tree(self):
+        """
+        build the tree to max_depth, against the search's deadline. A node's
+        children are all added before any of them is expanded, so the root
+        always has every child even when the deadline stops the build
+        """
         self._generate_tree_recursive(self.root, self.max_depth)
 
     def _generate_tree_recursive(self, node: Node, depth):
@@ -150,54 +190,88 @@ class MiniMax:
         actions = node.get_legal_actions()
         next_color = _SWITCH_COLOR[node.color]
         #print(spawns + spreads)
-        for action in actions:
-            child_state = deepcopy(node.state)
-            child_state.apply_action(action)
-            child_node = Node(child_state, next_color, node.level + 1, parent=node, action=action)
+        # all children in one batch, scored (blue's view, as evaluation) and
+        # checked for the end of the game before any Node exists
+        children = expand(node.state, actions)
+        scores = evaluate_batch(children.planes, PlayerColor.BLUE, endgame_threshold=None).tolist()
+        terminal = children.game_over().tolist()
+        for i, action in enumerate(actions):
+            child_node = Node(None, next_color, node.level + 1, parent=node, action=action,
+                              batch=(children, i), score=scores[i], terminal=terminal[i])
             node.add_child(child_node)
+        for child_node in node.children:
+            self.deadline.tick()
             self._generate_tree_recursive(child_node, depth - 1)
     
     def find_next_step(self):
         maximizing_player = self.root.color == PlayerColor.BLUE
         best_action = None
-        start_time = time.time()
-        time_limit = 5
+        # one deadline for building the tree and the whole iterative
+        # deepening run, an aborted iteration is thrown away and the last
+        # completed depth's move kept
+        self.deadline = Deadline(self.time_limit)
+        guess = None
+        try:
+            self.generate_tree()
+        except SearchTimeout:
+            # no time left to search a half built tree, go by the scores the
+            # root's children were generated with
+            pick = max if maximizing_player else min
+            return pick(self.root.children, key=self.heuristic).action if self.root.children else None
 
         for depth in range(1, self.max_depth + 1):
+            def search_root(alpha, beta):
+                return self._minimax_alpha_beta(self.root, depth, alpha, beta, maximizing_player)
             try:
-                current_value, current_action = self._minimax_alpha_beta(self.root, depth, float('-inf'), float('inf'), maximizing_player)
+                if self.search == "pvs":
+                    current_value, current_action = aspiration_search(search_root, guess)
+                else:
+                    current_value, current_action = search_root(float('-inf'), float('inf'))
                 best_action = current_action
-            except TimeoutError:
+                guess = current_value
+                self.completed_depth = depth
+            except SearchTimeout:
                 break
 
             # Check if the elapsed time exceeds the time limit
-            elapsed_time = time.time() - start_time
-            if elapsed_time >= time_limit:
+            if self.deadline.expired():
                 break
 
+        if best_action is None and self.root.children:
+            # not even depth 1 finished, take any generated move
+            best_action = self.root.children[0].action
         return best_action
 
 
     def heuristic(self, node: Node):
         return node.evaluation()
 
-    def _minimax_alpha_beta(self, node, depth, alpha, beta, maximizing_player, start_time=None, time_limit=5):
-        if start_time is None:
-            start_time = time.time()
+    def search_child(self, child: Node, depth, alpha, beta, maximizing_player, first):
+        """
+        value of a child, called with the child's side to move. In pvs mode
+        only the first child gets the full window
+        """
+        if self.search == "pvs" and not first:
+            window = null_window(alpha, beta, not maximizing_player)
+            if window is not None:
+                value, _ = self._minimax_alpha_beta(child, depth, *window, maximizing_player)
+                if value <= alpha or value >= beta:
+                    return value
+        value, _ = self._minimax_alpha_beta(child, depth, alpha, beta, maximizing_player)
+        return value
+
+    def _minimax_alpha_beta(self, node, depth, alpha, beta, maximizing_player):
+        self.deadline.tick()
 
         if depth == 0 or node.is_terminal_node():
             return node.evaluation(), node.action
         random.shuffle(node.children)
-        node.children.sort(key=self.heuristic, reverse=maximizing_player)
-        if time.time() - start_time >= time_limit:
-            raise TimeoutError("Time limit exceeded")
-
         node.children.sort(key=self.heuristic, reverse=maximizing_player)
         if maximizing_player:
             max_value = float('-inf')
             best_action = None
-            for child in node.children:
-                value, action = self._minimax_alpha_beta(child, depth - 1, alpha, beta, False, start_time, time_limit)
+            for i, child in enumerate(node.children):
+                value = self.search_child(child, depth - 1, alpha, beta, False, i == 0)
                 if value > max_value:
                     max_value = value
                     best_action = child.action
@@ -208,8 +282,8 @@ class MiniMax:
         else:
             min_value = float('inf')
             best_action = None
-            for child in node.children:
-                value, action = self._minimax_alpha_beta(child, depth - 1, alpha, beta, True, start_time, time_limit)
+            for i, child in enumerate(node.children):
+                value = self.search_child(child, depth - 1, alpha, beta, True, i == 0)
                 if value < min_value:
                     min_value = value
                     best_action = child.action
@@ -217,22 +291,3 @@ class MiniMax:
                 if beta <= alpha:
                     break
             return min_value, best_action
-
-
-    def print_tree(self):
-        total_nodes = self._print_tree_recursive(self.root, 0)
-        print(f"Total nodes: {total_nodes}")
-        return total_nodes
-
-    def _print_tree_recursive(self, node: Node, indent_level):
-        indent = '  ' * indent_level
-        if node.action:
-            print(f"{indent}{node.action} (Level: {node.level}, Value: {node.evaluation()})")
-        else:
-            print(f"{indent}Root (Level: {node.level}, Value: {node.evaluation()})")
-
-        node_count = 1  # Count the current node
-        for child in node.children:
-            node_count += self._print_tree_recursive(child, indent_level + 1)
-
-        return node_count
@@ -2,9 +2,21 @@
 # Project Part B: Game Playing Agent
 
 from referee.game import \
-    PlayerColor, Action, SpawnAction, SpreadAction, HexPos, HexDir, Board
+    PlayerColor, Action, SpawnAction, SpreadAction, HexPos
 from referee.game.constants import *
-from copy import deepcopy
+from infexion.bitboard import BitBoard
+from infexion.book import OpeningBook
+from infexion.snapshot import snapshot, no_fields
+from infexion.endgame import EndgameSolver, book_or_endgame_move
+from infexion.instrument import instrumented, move_stats
+from infexion.tt import TranspositionTable, EXACT, LOWER, UPPER
+from infexion.timing import Deadline, SearchTimeout, move_budget
+from infexion.evaluate import evaluate_batch, ENDGAME_THRESHOLD
+from infexion.batch import expand
+from infexion.ordering import MoveOrderer
+from infexion.search import aspiration_search, null_window
+from infexion.symmetry import canonical, map_move, unmap_move
+from infexion.tables import ACTIONS, action_index, cell_index
 import random
 import time
 _SWITCH_COLOR = {
@@ -24,32 +36,57 @@ COORDINATES = [
     if abs(r - q) < 7
 ]
 
+# memory cap for the transposition table kept between moves
+TT_SIZE_MB = 16
+# with ordering="eval" the search keeps at most this many nodes in its tree,
+# further children are searched without being kept
+NODE_BUDGET = 100000
+# symmetric transpositions are common only while the board is nearly empty,
+# later canonical keys cost more than they save
+SYMMETRY_PLIES = 6
+# leaves are searched on through capturing spreads for at most this many
+# plies, 0 turns quiescence off
+QUIESCENCE_PLIES = 4
+
 class Agent:
     def __init__(self, color: PlayerColor, **referee: dict):
         """
         Initialise the agent.
         """
         self._color = color
-        self.game_state = Board()
+        self.game_state = BitBoard()
         self.node_explore = []
         self.time_taken = []
+        # nodes searched for the last move, quiescence included
+        self.nodes = 0
+        self.tt = TranspositionTable(TT_SIZE_MB)
+        self.book = OpeningBook()
+        self.endgame = EndgameSolver()
+        self.stats = move_stats("minimax_test")
         match color:
             case PlayerColor.RED:
                 print("Testing: I am playing as red")
             case PlayerColor.BLUE:
                 print("Testing: I am playing as blue")
 
+    @instrumented
     def action(self, **referee: dict) -> Action:
         """
         Return the next action to take.
         """
+        quick_action = book_or_endgame_move(self, self.game_state, referee)
+        if quick_action is not None:
+            return quick_action
         match self._color:
             case PlayerColor.RED:
                 #random.seed(88)
                 #starttime = time.time()
-                minimax = MiniMax(self.game_state, PlayerColor.RED, max_depth=1)
+                time_limit = move_budget(referee.get("time_remaining"), self.game_state.turn_count) - self.endgame.seconds
+                minimax = MiniMax(self.game_state, PlayerColor.RED, max_depth=1, tt=self.tt, time_limit=time_limit,
+                                symmetric=self.game_state.turn_count < SYMMETRY_PLIES, stats=self.stats)
                 #minimax.generate_tree()
                 best_action = minimax.find_next_step()
+                self.nodes += minimax.nodes + minimax.quiescence_nodes
                 #endtime = time.time()
                 #print('time costs this round = ', endtime - starttime)
                 actions = minimax.root.get_legal_actions()
@@ -58,10 +95,15 @@ class Agent:
             case PlayerColor.BLUE:
                 # This is going to be invalid... BLUE never spawned!
                 #starttime = time.time()
-                minimax = MiniMax(self.game_state, PlayerColor.BLUE, max_depth=2)
+                time_limit = move_budget(referee.get("time_remaining"), self.game_state.turn_count) - self.endgame.seconds
+                minimax = MiniMax(self.game_state, PlayerColor.BLUE, max_depth=2, tt=self.tt, time_limit=time_limit,
+                                symmetric=self.game_state.turn_count < SYMMETRY_PLIES, stats=self.stats)
                 #minimax.generate_tree()
-                #total_nodes = minimax.print_tree()
                 best_action = minimax.find_next_step()
+                self.nodes += minimax.nodes + minimax.quiescence_nodes
+                # nodes share one board, so only the tree's shape is kept, and
+                # only ordering="eval" keeps more than the root
+                snapshot("minimax_test", minimax.root, self.game_state, no_fields)
                 #endtime = time.time()
                 #self.node_explore.append(total_nodes)
                 #self.time_taken.append(endtime - starttime)
@@ -87,7 +129,9 @@ class Agent:
                 pass
 
 class Node:
-    def __init__(self, state: Board, color: PlayerColor, level: int, action = None) -> None:
+    __slots__ = ("color", "state", "action", "level", "children")
+
+    def __init__(self, state: BitBoard, color: PlayerColor, level: int, action = None) -> None:
         self.color = color
         self.state = state
         self.action = action
@@ -101,20 +145,11 @@ class Node:
         return self.state.game_over
     
     def get_legal_actions(self):
-        spawns = []
-        spreads = []
-        directions = [HexDir.Down, HexDir.DownLeft, HexDir.DownRight, HexDir.Up, HexDir.UpLeft, HexDir.UpRight]
-        for cor in COORDINATES:
-            if self.state._cell_occupied(cor):
-                cellColor, cellPower = self.state[cor]
-                if cellColor == self.color:
-                    for direction in directions:
-                        spreads.append(SpreadAction(cor, direction))
-            else:
-                spawns.append(SpawnAction(cor))
+        spawns = self.state.spawn_actions()
+        spreads = self.state.spread_actions()
 
         random.shuffle(spawns)
-        if self.state._total_power >= 49:
+        if self.state.total_power >= 49:
             
             return spreads
         else:
@@ -122,49 +157,12 @@ class Node:
     
     def evaluation(self, root_color):
 
-        opp_power = 0
-        self_power = 0
-        opp_cells = 0
-        self_cells = 0
-
-        for cell in self.state._state.values():
-            if cell.player == root_color:
-                self_power += cell.power
-                self_cells += 1
-            elif cell.player == _SWITCH_COLOR[root_color]:
-                opp_power += cell.power
-                opp_cells += 2
-
-        power_score = self_power - opp_power
-        cell_score = self_cells - opp_cells
-        # Assign weights to each factor according to their importance
-        power_weight = 2
-        cell_weight = 1
-
-        total_cells = self_cells + opp_cells
-        endgame_threshold = int(0.5 * (7 * 7))  # 50% of the total board size
-
-        if total_cells >= endgame_threshold:
-            # Increase weights for more aggressive play when approaching the end of the game
-            power_weight = 3
-            cell_weight = 1
-
-        return (power_weight * power_score) + (cell_weight * cell_score)
-    
-    def evaluation_state(self, root_color, test_state):
-
-        opp_power = 0
-        self_power = 0
-        opp_cells = 0
-        self_cells = 0
-
-        for cell in test_state._state.values():
-            if cell.player == root_color:
-                self_power += cell.power
-                self_cells += 1
-            elif cell.player == _SWITCH_COLOR[root_color]:
-                opp_power += cell.power
-                opp_cells += 2
+        opp_color = _SWITCH_COLOR[root_color]
+        self_power = self.state.color_power(root_color)
+        opp_power = self.state.color_power(opp_color)
+        self_cells = self.state.color_cells(root_color)
+        # opponent cells count double
+        opp_cells = 2 * self.state.color_cells(opp_color)
 
         power_score = self_power - opp_power
         cell_score = self_cells - opp_cells
@@ -184,36 +182,269 @@ class Node:
 
     
 class MiniMax:
-    def __init__(self, root_state, curr_color, max_depth = 3):
-        self.root = Node(root_state, curr_color, level=0)
+    def __init__(self, root_state, curr_color, max_depth = 3, tt = None, time_limit = 0.8, ordering = "heuristic", search = "alphabeta",
+                 max_nodes = NODE_BUDGET, symmetric = False, stats = None, quiescence_plies = QUIESCENCE_PLIES):
+        # every node shares this one board, the search applies and undoes
+        # actions on it so a node's state is only valid while it is visited
+        self.board = root_state.copy()
+        self.root = Node(self.board, curr_color, level=0)
         self.max_depth = max_depth
+        # scores are from curr_color's point of view, so a table shared
+        # between moves must always be searched for the same colour
+        self.tt = tt if tt is not None else TranspositionTable(TT_SIZE_MB)
+        self.time_limit = time_limit
+        self.deadline = None
+        self.completed_depth = 0
+        # "heuristic" orders moves with the MoveOrderer, "eval" is the old
+        # ordering that evaluates every child first. Only "eval" uses the
+        # batched evaluate_batch scoring, "heuristic" scores leaves one at a
+        # time so a cutoff skips the rest
+        self.ordering = ordering
+        self.orderer = MoveOrderer()
+        # "alphabeta" searches every move in the full window, "pvs" proves the
+        # moves after the first with null windows and runs each iteration in
+        # an aspiration window around the previous score
+        self.search = search
+        # positions visited by the search, leaves included
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self.tree_size = 1
+        # key the transposition table by canonical position, so symmetric
+        # positions share one entry. Costs a canonical() per interior node
+        self.symmetric = symmetric
+        # SearchStats of the move, None when instrumentation is off
+        self.stats = stats
+        # leaves in the middle of a capture exchange are searched on this
+        # many plies, and the extra positions counted apart from self.nodes
+        self.quiescence_plies = quiescence_plies
+        self.quiescence_nodes = 0
     
     def find_next_step(self):
         maximizing_player = True
         best_action = None
-        start_time = time.time()
-        time_limit = 0.8
+        # the deadline is checked inside the search, so an iteration that
+        # runs out of time is abandoned and the last completed depth's move kept
+        self.deadline = Deadline(self.time_limit)
+        root_snapshot = self.board.copy()
+        guess = None
+        # the table lives across moves, so its counters are reported as deltas
+        tt_before = self.tt.stats()
 
         for depth in range(1, self.max_depth + 1):
-            
-            current_value, current_action = self._minimax_alpha_beta(self.root, depth, float('-inf'), float('inf'), maximizing_player, time_limit)
+            def search_root(alpha, beta):
+                return self._minimax_alpha_beta(self.root, depth, alpha, beta, maximizing_player)
+            try:
+                if self.search == "pvs":
+                    current_value, current_action = aspiration_search(search_root, guess)
+                else:
+                    current_value, current_action = search_root(float('-inf'), float('inf'))
+            except SearchTimeout:
+                # the aborted search unwound without undoing its actions
+                self.board.restore(root_snapshot)
+                break
             best_action = current_action
-                
+            guess = current_value
+            self.completed_depth = depth
 
             # Check if the elapsed time exceeds the time limit
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            if elapsed_time >= time_limit:
+            if self.deadline.expired():
                 break
-        
+
+        if best_action is None:
+            # not even depth 1 finished, fall back to the first legal action
+            best_action = self.root.get_legal_actions()[0]
+        if self.stats is not None:
+            self.stats.set(depth=self.completed_depth)
+            self.stats.count("nodes", self.nodes)
+            self.stats.count("quiescence_nodes", self.quiescence_nodes)
+            tt_after = self.tt.stats()
+            for name in ("hits", "misses", "collisions", "stores"):
+                self.stats.count(f"tt_{name}", tt_after[name] - tt_before[name])
         return best_action
 
-    def heuristic(self, node: Node):
-        return node.evaluation(self.root.color)
+    def child_scores(self, actions):
+        # every child's position in one batch straight from the board, then
+        # scored in one vectorised call, opponent cells count double as in
+        # Node.evaluation. Opt in: only used with ordering="eval", and for
+        # leaves only when quiescence is off
+        if self.stats is not None:
+            self.stats.count("evals", len(actions))
+            start = time.perf_counter()
+        children = expand(self.board, actions)
+        if self.stats is not None:
+            self.stats.lap("expand", start)
+        return evaluate_batch(children.planes, self.root.color, opp_cell_weight=2).tolist()
+
+    def heuristic_action(self, action):
+        if self.stats is not None:
+            self.stats.count("evals")
+        record = self.board.apply(action)
+        value = self.root.evaluation(self.root.color)
+        self.board.undo(record)
+        return value
+
+    def sort_children(self, node: Node, maximizing_player):
+        scores = self.child_scores([child.action for child in node.children])
+        order = sorted(range(len(scores)), key=scores.__getitem__, reverse=maximizing_player)
+        node.children = [node.children[i] for i in order]
+
+    def order_moves(self, node: Node, maximizing_player, tt_move):
+        """
+        the actions to search at node, best first. "eval" scores every child
+        already in the tree with the evaluation, "heuristic" asks the move
+        orderer (TT move, captures, killers, history) and evaluates nothing
+        """
+        if self.ordering == "heuristic":
+            return self.orderer.order(self.board, self.legal_actions(node), node.level, tt_move)
+        if not node.children:
+            actions = self.legal_actions(node)
+            # search the stored best move first
+            if tt_move in actions:
+                actions.remove(tt_move)
+                actions.insert(0, tt_move)
+            return actions
+        if len(node.children) > 1:
+            self.sort_children(node, maximizing_player)
+        if tt_move is not None:
+            for i, child in enumerate(node.children):
+                if child.action == tt_move:
+                    node.children.insert(0, node.children.pop(i))
+                    break
+        actions = [child.action for child in node.children]
+        # a cutoff last iteration leaves only some children in the tree
+        seen = set(actions)
+        return actions + [action for action in self.board.legal_actions() if action not in seen]
+
+    def legal_actions(self, node: Node):
+        if self.stats is None:
+            return node.get_legal_actions()
+        start = time.perf_counter()
+        actions = node.get_legal_actions()
+        self.stats.lap("move_gen", start)
+        return actions
+
+    def get_child(self, node: Node, i, action):
+        """
+        node for the i-th action of order_moves. Only "eval" ordering reads
+        children back, and it lists the kept children first in their order,
+        so the i-th child is the one if it is kept at all. "heuristic"
+        ordering keeps no tree
+        """
+        if self.ordering == "eval" and i < len(node.children) and node.children[i].action == action:
+            return node.children[i]
+        child = Node(self.board, _SWITCH_COLOR[node.color], node.level + 1, action=action)
+        if self.ordering == "eval" and (self.max_nodes is None or self.tree_size < self.max_nodes):
+            node.add_child(child)
+            self.tree_size += 1
+        return child
+
+    def record_cutoff(self, node: Node, action, depth):
+        if self.stats is not None:
+            self.stats.count("cutoffs")
+        if self.ordering == "heuristic":
+            self.orderer.cutoff(action, node.level, depth, self.board.capture_delta(action)[0])
+
+    def quiesce(self, alpha, beta, maximizing_player, plies):
+        """
+        Value of the board at a leaf. Only capturing spreads are searched,
+        and the side to move can stand pat on the evaluation instead, so a
+        quiet position scores as before. A capture is skipped (delta pruning)
+        when even its full swing could not move the score past the window.
+        """
+        self.deadline.tick()
+        if self.board.game_over:
+            if self.board.winner_color == self.root.color:
+                return float('inf')
+            return float('-inf')
+        stand_pat = self.root.evaluation(self.root.color)
+        if self.stats is not None:
+            self.stats.count("evals")
+            self.stats.maximum("quiescence_depth", self.quiescence_plies - plies)
+        if plies == 0:
+            return stand_pat
+        if (stand_pat >= beta) if maximizing_player else (stand_pat <= alpha):
+            if self.stats is not None:
+                self.stats.count("stand_pat_cutoffs")
+            return stand_pat
+        if maximizing_player:
+            alpha = max(alpha, stand_pat)
+        else:
+            beta = min(beta, stand_pat)
+
+        # the most a capture can move the evaluation: the power change at
+        # weight 2 or 3, 3 per target in cells (one of ours, two of theirs),
+        # and if the weighted cell count may cross the endgame threshold the
+        # weight switch alone, the whole power difference. A capture that
+        # can end the game is never pruned
+        state = self.board
+        own = state.turn_color
+        opp = _SWITCH_COLOR[own]
+        power_difference = abs(state.color_power(own) - state.color_power(opp))
+        root_color = self.root.color
+        total_cells = state.color_cells(root_color) + 2 * state.color_cells(_SWITCH_COLOR[root_color])
+        opp_cells = state.color_cells(opp)
+        captures = []
+        for action in state.spread_actions():
+            capture, delta = state.capture_delta(action)
+            if capture:
+                steps = state.power[cell_index(action.cell)]
+                if opp_cells <= steps or state.turn_count + 1 >= MAX_TURNS:
+                    swing = float('inf')
+                else:
+                    swing = max(2 * delta, 3 * delta) + 3 * steps
+                    # every cell moved changes the weighted count by at most 2
+                    if abs(total_cells - ENDGAME_THRESHOLD) <= 2 * (steps + 1):
+                        swing += power_difference
+                captures.append((swing, action))
+        captures.sort(key=lambda capture: capture[0], reverse=True)
+
+        best = stand_pat
+        for swing, action in captures:
+            if (maximizing_player and stand_pat + swing <= alpha) or \
+                    (not maximizing_player and stand_pat - swing >= beta):
+                # sorted by swing, so no later capture can do better
+                if self.stats is not None:
+                    self.stats.count("delta_pruned")
+                break
+            # the leaf itself was counted by the main search, these are extra
+            self.quiescence_nodes += 1
+            record = self.board.apply(action)
+            value = self.quiesce(alpha, beta, not maximizing_player, plies - 1)
+            self.board.undo(record)
+            if maximizing_player:
+                best = max(best, value)
+                alpha = max(alpha, best)
+            else:
+                best = min(best, value)
+                beta = min(beta, best)
+            if beta <= alpha:
+                break
+        return best
 
-    def _minimax_alpha_beta(self, node, depth, alpha, beta, maximizing_player, start_time=None, time_limit=1):
+    def search_child(self, child: Node, depth, alpha, beta, maximizing_player, first):
+        """
+        value of a child, called with the child's side to move. In pvs mode
+        only the first move gets the full window, the rest are searched with
+        a null window and again in full only when they beat the best so far
+        """
+        if self.search == "pvs" and not first:
+            window = null_window(alpha, beta, not maximizing_player)
+            if window is not None:
+                value, _ = self._minimax_alpha_beta(child, depth, *window, maximizing_player)
+                if value <= alpha or value >= beta:
+                    return value
+        value, _ = self._minimax_alpha_beta(child, depth, alpha, beta, maximizing_player)
+        return value
+
+    def _minimax_alpha_beta(self, node, depth, alpha, beta, maximizing_player):
+        self.deadline.tick()
+        self.nodes += 1
 
         if depth == 0 :
+            if self.quiescence_plies:
+                return self.quiesce(alpha, beta, maximizing_player, self.quiescence_plies), node.action
+            if self.stats is not None:
+                self.stats.count("evals")
             return node.evaluation(self.root.color), node.action
         if node.is_terminal_node():
             if node.state.winner_color == self.root.color:
@@ -221,71 +452,101 @@ class MiniMax:
             else:
                 return float('-inf'), node.action
 
-        if not node.children:
-            legal_actions = node.get_legal_actions()
-        node.children.sort(key=self.heuristic, reverse=maximizing_player)
+        # probe the transposition table, the root is always searched so it
+        # returns a move for this iteration
+        if self.symmetric:
+            # the entry's move is kept in the canonical frame
+            key, frame = canonical(self.board)
+        else:
+            key, frame = self.board.key, 0
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            _, entry_depth, flag, score, tt_move = entry
+            if tt_move is not None and frame:
+                tt_move = ACTIONS[unmap_move(action_index(tt_move), frame)]
+            if entry_depth >= depth and node is not self.root:
+                if flag == EXACT:
+                    return score, tt_move
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                elif flag == UPPER:
+                    beta = min(beta, score)
+                if beta <= alpha:
+                    return score, tt_move
+
+        actions = self.order_moves(node, maximizing_player, tt_move)
         best_action = None
         if maximizing_player:
             max_value = float('-inf')
-            if node.children:
-                for child in node.children:
-                    value, _ = self._minimax_alpha_beta(child, depth - 1, alpha, beta, False, start_time, time_limit)
-
-                    if value > max_value:
-                        max_value = value
-                        best_action = child.action
-                    alpha = max(alpha, max_value)
-                    if beta <= alpha:
-                        break
-                return max_value, best_action
-            
+            for i, action in enumerate(actions):
+                child_node = self.get_child(node, i, action)
+                record = self.board.apply(action)
+                value = self.search_child(child_node, depth - 1, alpha, beta, False, i == 0)
+                self.board.undo(record)
+
+                if value > max_value:
+                    max_value = value
+                    best_action = action
+                alpha = max(alpha, max_value)
+                if beta <= alpha:
+                    self.record_cutoff(node, action, depth)
+                    break
+            result = max_value
+        elif depth == 1:
+            # the replies are leaves, score them without a child node each
+            min_value = float('inf')
+            if self.ordering == "eval" and not self.quiescence_plies:
+                values = self.child_scores(actions) if actions else []
             else:
-                for action in legal_actions:
-                    child_state = deepcopy(node.state)
-                    child_state.apply_action(action)
-                    child_node = Node(child_state, _SWITCH_COLOR[node.color], node.level + 1,action=action)
-                    node.add_child(child_node)
-                    child_node.action = action
-                    value, _ = self._minimax_alpha_beta(child_node, depth - 1, alpha, beta, False, start_time, time_limit)
-
-                    if value > max_value:
-                        max_value = value
-                        best_action = action
-                    alpha = max(alpha, max_value)
-                    if beta <= alpha:
-                        break
-                return max_value, best_action
+                # one at a time, so a cutoff skips the rest of the evaluations
+                values = None
+            for i, action in enumerate(actions):
+                self.nodes += 1
+                if self.quiescence_plies:
+                    # the same leaf value as the depth 0 path: a capture left
+                    # for us is searched on, a quiet reply stands pat
+                    record = self.board.apply(action)
+                    value = self.quiesce(alpha, beta, True, self.quiescence_plies)
+                    self.board.undo(record)
+                elif values is not None:
+                    value = values[i]
+                else:
+                    value = self.heuristic_action(action)
+                if value < min_value:
+                    min_value = value
+                    best_action = action
+                beta = min(beta, min_value)
+                if beta <= alpha:
+                    self.record_cutoff(node, action, depth)
+                    break
+            result = min_value
         else:
             min_value = float('inf')
-            for action in legal_actions:
-                child_state = deepcopy(node.state)
-                child_state.apply_action(action)
-
-                value = self.root.evaluation_state(self.root.color, child_state)
+            for i, action in enumerate(actions):
+                child_node = self.get_child(node, i, action)
+                record = self.board.apply(action)
+                value = self.search_child(child_node, depth - 1, alpha, beta, True, i == 0)
+                self.board.undo(record)
 
                 if value < min_value:
                     min_value = value
                     best_action = action
                 beta = min(beta, min_value)
                 if beta <= alpha:
+                    self.record_cutoff(node, action, depth)
                     break
-            return min_value, best_action
-
+            result = min_value
 
-    def print_tree(self):
-        total_nodes = self._print_tree_recursive(self.root, 0)
-        print(f"Total nodes: {total_nodes}")
-        return total_nodes
-
-    def _print_tree_recursive(self, node: Node, indent_level):
-        indent = '  ' * indent_level
-        if node.action:
-            print(f"{indent}{node.action} (Level: {node.level}, Value: {node.evaluation()})")
+        if result <= alpha_orig:
+            flag = UPPER
+        elif result >= beta_orig:
+            flag = LOWER
         else:
-            print(f"{indent}Root (Level: {node.level}, Value: {node.evaluation()})")
-
-        node_count = 1  # Count the current node
-        for child in node.children:
-            node_count += self._print_tree_recursive(child, indent_level + 1)
-
-        return node_count
+            flag = EXACT
+        stored_move = best_action
+        if best_action is not None and frame:
+            stored_move = ACTIONS[map_move(action_index(best_action), frame)]
+        self.tt.store(key, depth, flag, result, stored_move)
+        return result, best_action
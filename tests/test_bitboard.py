@@ -0,0 +1,105 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+BitBoard against the referee's Board over seeded random games. Run from the
+repository root with python -m pytest tests
+"""
+
+import random
+import pytest
+from referee.game import PlayerColor, Board, SpawnAction, SpreadAction
+from referee.game.constants import *
+from infexion.bitboard import BitBoard
+from infexion.tables import COORDINATES, DIRECTIONS, action_index
+
+SEEDS = range(10)
+
+
+def same_position(bitboard: BitBoard, other: BitBoard):
+    assert bitboard.masks == other.masks
+    assert bitboard.power == other.power
+    assert bitboard.powers == other.powers
+    assert bitboard.turn == other.turn
+    assert bitboard.turn_count == other.turn_count
+    assert bitboard.key == other.key
+
+
+def referee_actions(board: Board) -> set:
+    # the referee's rules written out: spread any own stack any way, spawn on
+    # any empty cell below the power cap
+    actions = set()
+    for cell in COORDINATES:
+        player, power = board[cell]
+        if power == 0:
+            if board._total_power < MAX_TOTAL_POWER:
+                actions.add(SpawnAction(cell))
+        elif player == board.turn_color:
+            actions.update(SpreadAction(cell, direction) for direction in DIRECTIONS)
+    return actions
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_random_game_matches_referee(seed):
+    rng = random.Random(seed)
+    board = Board()
+    state = BitBoard()
+    while True:
+        same_position(BitBoard.from_board(board), state)
+        assert state.key == state.compute_key()
+        assert state.turn_color == board.turn_color
+        for color in PlayerColor:
+            assert state.color_power(color) == board._color_power(color)
+        assert state.game_over == board.game_over
+        assert state.winner_color == board.winner_color
+        if board.game_over:
+            break
+        actions = state.legal_actions()
+        assert len(actions) == len(set(actions))
+        assert set(actions) == referee_actions(board)
+        # a few actions besides the one played, each on copies of both. The
+        # copy of the referee board is rebuilt from its cells, which drops
+        # the history and so the turn count
+        for action in rng.sample(actions, min(3, len(actions))):
+            child_board = Board(dict(board._state), board.turn_color)
+            child_board.apply_action(action)
+            child = state.copy()
+            child.apply_action(action)
+            expected = BitBoard.from_board(child_board)
+            expected.turn_count = child.turn_count
+            same_position(expected, child)
+        action = rng.choice(actions)
+        board.apply_action(action)
+        state.apply_action(action)
+
+
+def test_legal_move_mask_matches_legal_actions():
+    rng = random.Random(0)
+    state = BitBoard()
+    while not state.game_over:
+        actions = state.legal_actions()
+        assert state.legal_move_mask() == sum(1 << action_index(action) for action in actions)
+        state.apply_action(rng.choice(actions))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_apply_undo_restores_position(seed):
+    rng = random.Random(seed)
+    state = BitBoard()
+    start = state.copy()
+    records = []
+    while not state.game_over:
+        before = state.copy()
+        # every legal action applied and taken back leaves the position as it was
+        for action in state.legal_actions():
+            record = state.apply(action)
+            expected = before.copy()
+            expected.apply_action(action)
+            same_position(state, expected)
+            state.undo(record)
+            same_position(state, before)
+        records.append(state.apply(rng.choice(state.legal_actions())))
+    # and the whole game unwinds back to the empty board
+    for record in reversed(records):
+        state.undo(record)
+    same_position(state, start)
@@ -0,0 +1,73 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+EndgameSolver against a plain negamax over every line to the turn limit, on
+small random positions a few turns from the end
+"""
+
+import random
+import pytest
+from referee.game.constants import *
+from infexion.bitboard import BitBoard, RED, BLUE
+from infexion.endgame import EndgameSolver, WIN, DRAW, LOSS
+from infexion.tables import NUM_CELLS
+
+
+def small_position(rng: random.Random, turns_left: int) -> BitBoard:
+    # two to four stacks with both colours on the board, turns_left turns
+    # before the limit
+    state = BitBoard(rng.choice((RED, BLUE)))
+    cells = rng.sample(range(NUM_CELLS), rng.randint(2, 4))
+    for i, idx in enumerate(cells):
+        color = i % 2 if i < 2 else rng.choice((RED, BLUE))
+        power = rng.randint(1, 3)
+        state.masks[color] |= 1 << idx
+        state.power[idx] = power
+        state.powers[color] += power
+    state.turn_count = MAX_TURNS - turns_left
+    state.key = state.compute_key()
+    return state
+
+
+def brute_force(state: BitBoard, memo: dict) -> int:
+    # WIN, DRAW or LOSS for the side to move with perfect play
+    if state.game_over:
+        own = state.powers[state.turn]
+        opp = state.powers[state.turn ^ 1]
+        if abs(own - opp) < WIN_POWER_DIFF:
+            return DRAW
+        return WIN if own > opp else LOSS
+    key = (state.key, state.turn_count)
+    if key not in memo:
+        best = LOSS
+        for action in state.legal_actions():
+            record = state.apply(action)
+            best = max(best, -brute_force(state, memo))
+            state.undo(record)
+        memo[key] = best
+    return memo[key]
+
+
+@pytest.mark.parametrize("turns_left", [1, 2, 3])
+def test_solver_matches_brute_force(turns_left):
+    rng = random.Random(turns_left)
+    memo = {}
+    for _ in range(12 if turns_left < 3 else 4):
+        state = small_position(rng, turns_left)
+        expected = brute_force(state.copy(), memo)
+        result, action = EndgameSolver().solve(state, time_limit=60.0)
+        assert result == expected
+        # the move it gives gets the result it claims
+        child = state.copy()
+        child.apply_action(action)
+        assert -brute_force(child, memo) == result
+
+
+def test_solver_keeps_results_between_solves():
+    # the tables carry over, and a second solve of the same position agrees
+    rng = random.Random(0)
+    solver = EndgameSolver()
+    state = small_position(rng, 2)
+    first = solver.solve(state, time_limit=60.0)
+    assert solver.solve(state, time_limit=60.0)[0] == first[0]
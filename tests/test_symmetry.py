@@ -0,0 +1,93 @@
+# COMP30024 Artificial Intelligence, Semester 1 2023
+# Project Part B: Game Playing Agent
+
+"""
+The symmetry group against positions moved stack by stack, over positions
+from seeded random games
+"""
+
+import random
+import pytest
+from infexion.bitboard import BitBoard, RED, BLUE, iter_bits
+from infexion.symmetry import CELL_MAPS, NUM_TRANSFORMS, INVERSE, canonical, stabilizer, \
+    compose, transform_key, map_move, unmap_move
+from infexion.tables import ACTIONS, NUM_MOVES, action_index
+
+SEEDS = range(5)
+
+
+def transformed(state: BitBoard, t: int) -> BitBoard:
+    # state with every stack moved by transform t
+    other = BitBoard(state.turn)
+    other.turn_count = state.turn_count
+    cell_map = CELL_MAPS[t]
+    for color in (RED, BLUE):
+        for idx in iter_bits(state.masks[color]):
+            other.masks[color] |= 1 << cell_map[idx]
+            other.power[cell_map[idx]] = state.power[idx]
+    other.powers = state.powers.copy()
+    other.key = other.compute_key()
+    return other
+
+
+def positions(seed: int, plies: int = 60):
+    rng = random.Random(seed)
+    state = BitBoard()
+    for _ in range(plies):
+        if state.game_over:
+            break
+        state.apply_action(rng.choice(state.legal_actions()))
+        yield state.copy()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_canonical_is_invariant(seed):
+    rng = random.Random(seed)
+    for state in positions(seed):
+        key, t = canonical(state)
+        assert transform_key(state, t) == key
+        for s in rng.sample(range(NUM_TRANSFORMS), 8):
+            other = transformed(state, s)
+            assert transform_key(state, s) == other.key
+            assert canonical(other)[0] == key
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_stabilizer_fixes_position(seed):
+    for state in positions(seed, plies=12):
+        symmetries = stabilizer(state)
+        assert 0 in symmetries
+        assert set(symmetries) == {t for t in range(NUM_TRANSFORMS) if transform_key(state, t) == state.key}
+
+
+def test_map_move_round_trip():
+    for t in range(NUM_TRANSFORMS):
+        images = [map_move(move, t) for move in range(NUM_MOVES)]
+        assert sorted(images) == list(range(NUM_MOVES))
+        assert [unmap_move(image, t) for image in images] == list(range(NUM_MOVES))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_map_move_commutes_with_moves(seed):
+    # playing a move and then transforming gives the same position as
+    # transforming and then playing the mapped move
+    rng = random.Random(seed)
+    for state in positions(seed, plies=30):
+        t = rng.randrange(NUM_TRANSFORMS)
+        other = transformed(state, t)
+        for action in state.legal_actions():
+            child = state.copy()
+            child.apply_action(action)
+            other_child = other.copy()
+            other_child.apply_action(ACTIONS[map_move(action_index(action), t)])
+            assert transformed(child, t).key == other_child.key
+
+
+def test_compose_and_inverse():
+    rng = random.Random(0)
+    state = list(positions(0, plies=20))[-1]
+    for _ in range(50):
+        s = rng.randrange(NUM_TRANSFORMS)
+        t = rng.randrange(NUM_TRANSFORMS)
+        assert transformed(transformed(state, t), s).key == transform_key(state, compose(s, t))
+        assert compose(INVERSE[t], t) == 0